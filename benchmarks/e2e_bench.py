@@ -0,0 +1,402 @@
+# e2e_bench.py - 端到端基准：在本机启动RSS/文章站点、兼容OpenAI的大模型接口和微信接口的模拟服务，
+# 用模拟行情数据替换yfinance，在子进程中运行 news_report，统计各阶段耗时、吞吐量和内存峰值
+# 用法: python benchmarks/e2e_bench.py [--scenario baseline slow_feeds ...] [--json 结果文件] [--tracemalloc]
+# 每个模拟RSS主机绑定在不同的回环地址（127.0.0.2起）上，按主机限流的效果与真实环境一致（需要Linux）
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试场景：RSS源数量、每个源的条目数、各类服务的延迟（秒）和失败率
+BASE_SCENARIO = {
+    'feeds': 14,
+    'entries': 8,
+    'feed_latency': 0.05,
+    'article_latency': 0.08,
+    'slow_feed_ratio': 0.0,
+    'slow_feed_latency': 0.0,
+    'flaky_host_ratio': 0.0,
+    'flaky_failure_rate': 0.0,
+    'llm_first_token': 0.5,
+    'llm_chunk_delay': 0.01,
+    'market_latency': 0.05,
+    'wechat_latency': 0.02,
+    'recipients': 20,
+}
+
+SCENARIOS = {
+    'baseline': {},
+    # 三成RSS源响应很慢
+    'slow_feeds': {'slow_feed_ratio': 0.3, 'slow_feed_latency': 2.0},
+    # RSS源数量扩大到10倍
+    'feeds_10x': {'feeds': 140},
+    # 四分之一的主机有一半请求返回503
+    'flaky_hosts': {'flaky_host_ratio': 0.25, 'flaky_failure_rate': 0.5},
+}
+
+WORDS = ('market', 'inflation', 'rates', 'central', 'bank', 'earnings', 'growth', 'trade', 'tariff',
+         'bond', 'yield', 'equity', 'rally', 'selloff', 'oil', 'gold', 'dollar', 'yuan', 'export',
+         'policy', 'stimulus', 'housing', 'credit', 'chip', 'energy', 'retail', 'consumer', 'jobs',
+         'payrolls', 'forecast', 'guidance', 'merger', 'ipo', 'regulator', 'fund', 'hedge', 'index',
+         'volatility', 'futures', 'commodity')
+
+# 模拟服务的请求统计，多个服务线程共享
+class ServiceStats:
+    def __init__(self):
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+# 正文中夹带常见虚词，newspaper按停用词密度识别正文段落
+STOP_WORDS = ('the', 'of', 'and', 'in', 'to', 'is', 'for', 'with', 'that', 'on')
+
+def _sentence(rng, words=14):
+    return " ".join(f"{rng.choice(STOP_WORDS)} {rng.choice(WORDS)}" for _ in range(words // 2)).capitalize() + "."
+
+# RSS与文章站点：/feed/<n>.xml 返回RSS，/article/<n>-<j>.html 返回文章页面
+class ContentHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path).path
+        kind = 'feed' if path.startswith('/feed/') else 'article'
+        time.sleep(server.latency[kind])
+        with server.rng_lock:
+            failed = server.rng.random() < server.failure_rate
+        if failed:
+            server.stats.add(f'{kind}_failures')
+            self.send_error(503)
+            return
+
+        # 同一地址每次返回相同的内容
+        rng = random.Random(path)
+        if kind == 'feed':
+            feed_id = path.rsplit('/', 1)[-1].split('.')[0]
+            items = "".join(
+                f"<item><title>{' '.join(rng.choice(WORDS) for _ in range(8))} {feed_id}-{j}</title>"
+                f"<link>{server.base_url}/article/{feed_id}-{j}.html</link>"
+                f"<guid>{server.base_url}/article/{feed_id}-{j}</guid></item>"
+                for j in range(server.entries))
+            body = (f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+                    f'<title>feed {feed_id}</title><link>{server.base_url}</link>{items}</channel></rss>')
+            content_type = 'application/rss+xml; charset=utf-8'
+        else:
+            paragraphs = "".join(f"<p>{' '.join(_sentence(rng) for _ in range(5))}</p>" for _ in range(8))
+            body = (f"<html><head><title>{_sentence(rng, 8)}</title></head><body>"
+                    f"<article><h1>{_sentence(rng, 8)}</h1>{paragraphs}</article></body></html>")
+            content_type = 'text/html; charset=utf-8'
+
+        data = body.encode('utf-8')
+        server.stats.add(f'{kind}_requests')
+        server.stats.add('bytes_sent', len(data))
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+# 模拟大模型回复：带标题、粗体和列表的Markdown
+def _llm_reply(rng):
+    lines = []
+    for section in ('宏观政策', '金融市场', '行业动态', '风险提示'):
+        lines.append(f"## {section}")
+        for _ in range(4):
+            lines.append(f"- **{rng.choice(WORDS)}** {_sentence(rng, 20)}")
+        lines.append("")
+    return "\n".join(lines)
+
+# 兼容OpenAI的聊天补全接口：POST /v1/chat/completions，支持流式（SSE）和非流式返回
+class LLMHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+        prompt_chars = sum(len(message.get('content', '')) for message in request.get('messages', []))
+        with server.rng_lock:
+            reply = _llm_reply(random.Random(server.rng.random()))
+        usage = {'prompt_tokens': prompt_chars, 'completion_tokens': len(reply), 'total_tokens': prompt_chars + len(reply)}
+        server.stats.add('llm_requests')
+        server.stats.add('llm_prompt_chars', prompt_chars)
+        time.sleep(server.first_token)
+
+        base = {'id': 'bench', 'object': 'chat.completion', 'created': int(time.time()), 'model': request.get('model')}
+        if not request.get('stream'):
+            data = json.dumps(dict(base, choices=[{
+                'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': reply}}],
+                usage=usage)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        base['object'] = 'chat.completion.chunk'
+        for i in range(0, len(reply), 24):
+            chunk = dict(base, choices=[{'index': 0, 'finish_reason': None, 'delta': {'content': reply[i:i + 24]}}])
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(server.chunk_delay)
+        self.wfile.write(f"data: {json.dumps(dict(base, choices=[], usage=usage))}\n\ndata: [DONE]\n\n".encode('utf-8'))
+
+# 微信接口：获取access_token和发送模板消息
+class WeChatHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.stats.add('wechat_token_requests')
+        self._reply({'access_token': 'bench-token', 'expires_in': 7200})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        self.server.stats.add('wechat_messages')
+        self._reply({'errcode': 0, 'errmsg': 'ok'})
+
+def _start(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+# 启动一个场景的全部模拟服务，返回 (服务列表, RSS配置, 环境变量)
+def start_services(scenario, stats, seed):
+    rng = random.Random(seed)
+    servers = []
+    rss_feeds = {}
+    feed_count = scenario['feeds']
+    slow = set(rng.sample(range(feed_count), int(feed_count * scenario['slow_feed_ratio'])))
+    flaky = set(rng.sample(range(feed_count), int(feed_count * scenario['flaky_host_ratio'])))
+    for index in range(feed_count):
+        host = f"127.0.{index // 250}.{index % 250 + 2}"
+        server = ThreadingHTTPServer((host, 0), ContentHandler)
+        server.daemon_threads = True
+        server.base_url = f"http://{host}:{server.server_address[1]}"
+        server.entries = scenario['entries']
+        server.latency = {
+            'feed': scenario['slow_feed_latency'] if index in slow else scenario['feed_latency'],
+            'article': scenario['article_latency'],
+        }
+        server.failure_rate = scenario['flaky_failure_rate'] if index in flaky else 0.0
+        server.rng = random.Random(seed * 1000 + index)
+        server.rng_lock = threading.Lock()
+        server.stats = stats
+        servers.append(_start(server))
+        rss_feeds.setdefault(f"分类{index % 5}", {})[f"来源{index}"] = f"{server.base_url}/feed/{index}.xml"
+
+    llm = ThreadingHTTPServer(('127.0.0.1', 0), LLMHandler)
+    llm.daemon_threads = True
+    llm.first_token = scenario['llm_first_token']
+    llm.chunk_delay = scenario['llm_chunk_delay']
+    llm.rng = random.Random(seed)
+    llm.rng_lock = threading.Lock()
+    llm.stats = stats
+    servers.append(_start(llm))
+
+    wechat = ThreadingHTTPServer(('127.0.0.1', 0), WeChatHandler)
+    wechat.daemon_threads = True
+    wechat.latency = scenario['wechat_latency']
+    wechat.stats = stats
+    servers.append(_start(wechat))
+
+    recipients = [f"bench-openid-{i}" for i in range(scenario['recipients'])]
+    env = {
+        'LLM_API_BASE': f"http://127.0.0.1:{llm.server_address[1]}/v1",
+        'WECHAT_API_BASE': f"http://127.0.0.1:{wechat.server_address[1]}",
+        'AI_SERVICE': 'deepseek',
+        'DEEPSEEK_API_KEY': 'bench',
+        'APP_ID': 'bench-app',
+        'APP_SECRET': 'bench-secret',
+        'TEMPLATE_ID': 'bench-template',
+        'OPEN_ID': recipients[0] if recipients else '',
+        'OPEN_IDS': ",".join(recipients),
+        'LLM_CACHE_BYPASS': '1',
+        'NEWS_ONLY_NEW': '0',
+    }
+    return servers, rss_feeds, env
+
+# 模拟行情数据源（接口与 sector_stock_analysis.YFinanceSource 相同），在子进程中使用
+class FakeMarketData:
+    def __init__(self, latency, seed):
+        self.latency = latency
+        self.seed = seed
+
+    def _rng(self, key):
+        return random.Random(f"{self.seed}-{key}")
+
+    def info(self, symbol, timeout=None):
+        time.sleep(self.latency)
+        rng = self._rng(symbol)
+        price = rng.uniform(20, 500)
+        return {
+            'longName': f"{symbol} Holdings", 'currency': 'USD', 'exchange': 'NMS',
+            'forwardPE': rng.uniform(5, 60), 'currentPrice': price, 'profitMargins': rng.uniform(-0.05, 0.35),
+        }
+
+    def _closes(self, key, days):
+        rng = self._rng(key)
+        price = rng.uniform(20, 500)
+        closes = []
+        for _ in range(days):
+            price *= 1 + rng.uniform(-0.01, 0.02)
+            closes.append(price)
+        return closes
+
+    def history(self, symbol, period, timeout=None):
+        import pandas as pd
+        time.sleep(self.latency)
+        index = pd.bdate_range(end=pd.Timestamp.now(tz='America/New_York').normalize(), periods=5)
+        return pd.DataFrame({'Close': self._closes(symbol, len(index))}, index=index)
+
+    def close_prices(self, symbols, period, timeout=None):
+        import pandas as pd
+        time.sleep(self.latency)
+        index = pd.bdate_range(end=pd.Timestamp.now(tz='America/New_York').normalize(), periods=5)
+        return pd.DataFrame({symbol: self._closes(symbol, len(index)) for symbol in symbols}, index=index)
+
+# 子进程：替换行情数据源和RSS配置后运行一次 news_report，把统计结果写入 result_path
+def run_child(config_path, result_path):
+    import resource
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    sys.path.insert(0, REPO_ROOT)
+    import sector_stock_analysis
+    sector_stock_analysis.market_data = FakeMarketData(config['market_latency'], config['seed'])
+    import finance_news_push
+    finance_news_push.rss_feeds = config['rss_feeds']
+
+    if config['tracemalloc']:
+        import tracemalloc
+        tracemalloc.start()
+    start = time.perf_counter()
+    results, timings = finance_news_push.news_report()
+    elapsed = time.perf_counter() - start
+    traced_peak = None
+    if config['tracemalloc']:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+
+    articles = results.get('articles')
+    send = results.get('send') or {}
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'elapsed': elapsed,
+            'timings': timings,
+            'articles': len(articles[2]) if articles else 0,
+            'sent': send.get('success', 0),
+            'send_failed': send.get('failed', 0),
+            # Linux下ru_maxrss单位为KB
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'traced_peak_bytes': traced_peak,
+        }, f)
+
+def run_scenario(name, overrides, args):
+    scenario = dict(BASE_SCENARIO, **overrides)
+    stats = ServiceStats()
+    servers, rss_feeds, service_env = start_services(scenario, stats, args.seed)
+    try:
+        with tempfile.TemporaryDirectory(prefix=f"e2e-{name}-") as workdir:
+            config_path = os.path.join(workdir, 'config.json')
+            result_path = os.path.join(workdir, 'result.json')
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump({'rss_feeds': rss_feeds, 'market_latency': scenario['market_latency'],
+                           'seed': args.seed, 'tracemalloc': args.tracemalloc}, f, ensure_ascii=False)
+
+            env = {key: value for key, value in os.environ.items()
+                   if key.lower() not in ('http_proxy', 'https_proxy', 'all_proxy')}
+            env.update(service_env)
+            env['NEWS_CACHE_DIR'] = os.path.join(workdir, '.cache')
+            env['PYTHONPATH'] = REPO_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+            # 子进程的工作目录为临时目录，生成的页面不会覆盖仓库中的文件
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', config_path, result_path],
+                cwd=workdir, env=env, capture_output=not args.verbose, text=True, timeout=args.timeout,
+            )
+            if child.returncode != 0:
+                raise RuntimeError(f"场景 {name} 运行失败:\n{child.stderr}")
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+    durations = {stage: timing['duration'] for stage, timing in result['timings'].items()}
+    result.update({
+        'scenario': name,
+        'config': scenario,
+        'services': stats.counts,
+        'article_throughput': result['articles'] / durations['articles'] if durations.get('articles') else 0.0,
+        'send_throughput': result['sent'] / durations['send'] if durations.get('send') else 0.0,
+    })
+    return result
+
+def print_table(results):
+    stages = ('articles', 'summary', 'stock', 'compose', 'html', 'send')
+    header = f"{'场景':<12}{'总耗时':>8}" + "".join(f"{stage:>9}" for stage in stages) + \
+        f"{'文章/秒':>9}{'消息/秒':>9}{'RSS请求':>9}{'失败':>6}{'内存峰值MB':>12}"
+    print(header)
+    for result in results:
+        durations = {stage: timing['duration'] for stage, timing in result['timings'].items()}
+        services = result['services']
+        peak = result['traced_peak_bytes'] or result['peak_rss_bytes']
+        print(f"{result['scenario']:<12}{result['elapsed']:>8.2f}"
+              + "".join(f"{durations.get(stage, 0.0):>9.2f}" for stage in stages)
+              + f"{result['article_throughput']:>9.1f}{result['send_throughput']:>9.1f}"
+              + f"{services.get('feed_requests', 0):>9}"
+              + f"{services.get('feed_failures', 0) + services.get('article_failures', 0):>6}"
+              + f"{peak / 1024 / 1024:>12.1f}")
+    print("内存峰值为" + ("tracemalloc统计的Python分配峰值" if results and results[0]['traced_peak_bytes'] else "进程RSS峰值"))
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3])
+        return 0
+
+    parser = argparse.ArgumentParser(description="使用本地模拟服务测量 news_report 的端到端性能")
+    parser.add_argument('--scenario', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS), help="要运行的场景")
+    parser.add_argument('--json', help="把完整结果写入JSON文件")
+    parser.add_argument('--seed', type=int, default=1, help="随机数种子（决定慢速/故障主机和模拟内容）")
+    parser.add_argument('--tracemalloc', action='store_true', help="用tracemalloc统计Python内存分配峰值（会拖慢运行）")
+    parser.add_argument('--timeout', type=float, default=600, help="单个场景的超时时间（秒）")
+    parser.add_argument('--verbose', action='store_true', help="显示 news_report 的输出")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenario:
+        print(f"运行场景 {name} ...", flush=True)
+        results.append(run_scenario(name, SCENARIOS[name], args))
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
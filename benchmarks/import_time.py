@@ -0,0 +1,61 @@
+# import_time.py - 启动耗时基准：用 python -X importtime 测量模块导入耗时，并检查预算
+# 用法: python benchmarks/import_time.py [--budget-ms 300] [--module finance_news_push] [--top 10]
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 这些重量级依赖只应在真正使用时导入，出现在启动阶段即视为超出预算
+LAZY_MODULES = ('openai', 'feedparser', 'newspaper', 'yfinance', 'pandas', 'numpy', 'requests')
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+# 在独立的子进程中导入模块，返回 [(模块名, 自身耗时us, 累计耗时us, 层级)]
+def measure_import(module):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = REPO_ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr}")
+
+    records = []
+    for line in result.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            records.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description="测量模块导入耗时并检查预算")
+    parser.add_argument('--module', action='append', help="要测量的模块，可重复指定")
+    parser.add_argument('--budget-ms', type=float, default=300.0, help="每个模块的累计导入耗时预算（毫秒）")
+    parser.add_argument('--top', type=int, default=10, help="显示累计耗时最多的前N个依赖")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or ['finance_news_push', 'sector_stock_analysis']:
+        records = measure_import(module)
+        total_ms = next(cumulative for name, _, cumulative, depth in records if name == module and depth == 0) / 1000
+        eager = sorted({name.split('.')[0] for name, *_ in records} & set(LAZY_MODULES))
+
+        over_budget = total_ms > args.budget_ms
+        status = "超出预算" if over_budget or eager else "通过"
+        print(f"{module}: {total_ms:.1f}ms (预算 {args.budget_ms:.0f}ms) - {status}")
+        if eager:
+            print(f"  启动时导入了应延迟加载的依赖: {', '.join(eager)}")
+        top = sorted((r for r in records if r[3] == 1), key=lambda r: r[2], reverse=True)[:args.top]
+        for name, _, cumulative, _ in top:
+            print(f"  {cumulative / 1000:8.1f}ms  {name}")
+        failed = failed or over_budget or bool(eager)
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
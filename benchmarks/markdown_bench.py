@@ -0,0 +1,78 @@
+# markdown_bench.py - Markdown转HTML基准：对比单遍转换器与原有的正则替换链，并检查输出一致
+# 用法: python benchmarks/markdown_bench.py [--sections 20 200 2000] [--unclosed 300] [--repeat 5]
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from markdown_render import convert_markdown_to_html
+
+# 原有实现（generate_summary_html 中的正则替换链），作为对比基准和输出一致性的参照
+def legacy_convert_markdown_to_html(content):
+    formatted = content
+    formatted = formatted.replace('\n# ', '\n<h1>')
+    formatted = formatted.replace('\n## ', '\n<h2>')
+    formatted = formatted.replace('\n### ', '\n<h3>')
+    formatted = formatted.replace('\n#### ', '\n<h4>')
+    for level in range(4, 0, -1):
+        formatted = re.sub(
+            r'<h{level}>(.*?)(?=\n<h|\Z)'.format(level=level),
+            r'<h{level}>\1</h{level}>'.format(level=level),
+            formatted,
+            flags=re.DOTALL
+        )
+    formatted = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', formatted)
+    formatted = re.sub(r'\[(.*?)\]\(((?:[^()]|\((?:[^()]|\([^()]*\))*\))*)\)', r'<a href="\2">\1</a>', formatted)
+    formatted = formatted.replace('\n', '<br>')
+    return formatted
+
+# 构造与实际摘要结构相同的文本：抬头、分级标题、粗体要点、新闻链接列表
+def build_summary(sections):
+    parts = ["📅 **2024-01-01 财经新闻每日速递**\n\n✍️ **今日分析总结：**\n"]
+    for i in range(sections):
+        parts.append(f"## {i + 1}. 市场要点\n")
+        parts.append(f"### 宏观与政策\n- **央行** 维持利率不变，市场预期下季度降息（来源: [新闻{i}](https://example.com/a?id={i}&q=(x)))\n")
+        parts.append("- 美元指数走弱，**黄金**上涨1.2%，原油价格震荡\n")
+        parts.append("#### 行业影响\n1. 科技板块受益于流动性预期\n2. 消费板块关注 **假期数据**\n\n")
+    parts.append("\n---\n\n## 📊 板块与股票分析\n\n")
+    for i in range(sections):
+        parts.append(f"- [公司{i}发布财报](https://example.com/news/{i})\n")
+    return "".join(parts)
+
+# 大量未闭合的链接（缺少右括号，地址会一直匹配到文末），原实现匹配失败时会逐字符回溯
+def build_unclosed_links(count):
+    return "".join(f"- 参考[{i}](https://example.com/" + "x" * 40 + "\n" for i in range(count))
+
+def best_of(func, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="对比Markdown转HTML的耗时并检查输出一致")
+    parser.add_argument('--sections', type=int, nargs='+', default=[20, 200, 2000], help="测试文本包含的段落数")
+    parser.add_argument('--unclosed', type=int, default=300, help="未闭合链接场景的行数")
+    parser.add_argument('--repeat', type=int, default=5, help="每种实现重复执行次数（取最短耗时）")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'段落数':>8} {'文本长度':>10} {'原实现(ms)':>12} {'新实现(ms)':>12} {'加速比':>8}  输出一致")
+    cases = [(sections, build_summary(sections)) for sections in args.sections]
+    cases.append(("未闭合链接", build_unclosed_links(args.unclosed)))
+    for sections, text in cases:
+        identical = convert_markdown_to_html(text) == legacy_convert_markdown_to_html(text)
+        legacy = best_of(legacy_convert_markdown_to_html, text, args.repeat)
+        current = best_of(convert_markdown_to_html, text, args.repeat)
+        print(f"{sections:>8} {len(text):>10} {legacy * 1000:>12.2f} {current * 1000:>12.2f} "
+              f"{legacy / current:>7.1f}x  {'是' if identical else '否'}")
+        failed = failed or not identical
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# feed_health.py - RSS源健康记录与熔断：持久化每个源最近的成功率、耗时分位数和最近成功时间
+# 连续失败达到阈值的源进入熔断（open），冷却期内不再请求；冷却期过后试探一次（half_open），
+# 试探成功则恢复正常，失败则重新熔断并把冷却期加倍
+import os
+import time
+import threading
+import local_cache
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+# 每个源保存最近 window 次的结果 [时间戳, 是否成功, 耗时]，以及连续失败次数、最近成功/失败时间和熔断状态
+class FeedHealth:
+    def __init__(self, failure_threshold=3, cooldown=12 * 3600, max_cooldown=72 * 3600, window=50, cache_dir=None):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.max_cooldown = max(cooldown, max_cooldown)
+        self.window = window
+        self.path = os.path.join(cache_dir or local_cache.CACHE_DIR, "feed_health.json")
+        self._lock = threading.Lock()
+        self._sources = None
+
+    # 首次使用时才读取记录文件
+    def _records(self):
+        if self._sources is None:
+            self._sources = (local_cache.read_json(self.path) or {}).get('sources', {})
+        return self._sources
+
+    def state(self, url, now=None):
+        with self._lock:
+            record = self._records().get(url)
+            if not record or record.get('opened_at') is None:
+                return CLOSED
+            if (now or time.time()) - record['opened_at'] < record['cooldown']:
+                return OPEN
+            return HALF_OPEN
+
+    # 记录一次获取结果（latency 为包含重试在内的总耗时，秒）
+    def record(self, url, ok, latency, now=None):
+        now = now or time.time()
+        with self._lock:
+            record = self._records().setdefault(url, {
+                'results': [], 'consecutive_failures': 0, 'last_success': None, 'last_failure': None,
+                'opened_at': None, 'cooldown': self.cooldown,
+            })
+            record['results'].append([round(now), 1 if ok else 0, round(latency, 3)])
+            del record['results'][:-self.window]
+            if ok:
+                record.update(consecutive_failures=0, last_success=now, opened_at=None, cooldown=self.cooldown)
+                return
+            record['consecutive_failures'] += 1
+            record['last_failure'] = now
+            if record['opened_at'] is not None:
+                # 试探失败，重新熔断并延长冷却期
+                record['cooldown'] = min(self.max_cooldown, record['cooldown'] * 2)
+                record['opened_at'] = now
+            elif record['consecutive_failures'] >= self.failure_threshold:
+                record['opened_at'] = now
+
+    # 单个源的健康统计：成功率、成功请求的P50/P95耗时、最近成功时间、连续失败次数和熔断状态
+    def stats(self, url, now=None):
+        state = self.state(url, now)
+        with self._lock:
+            record = self._records().get(url)
+            if not record:
+                return None
+            results = record['results']
+            latencies = sorted(latency for _, ok, latency in results if ok)
+            return {
+                'state': state,
+                'success_rate': round(sum(ok for _, ok, _ in results) / len(results), 3) if results else None,
+                'p50': _percentile(latencies, 0.5) if latencies else None,
+                'p95': _percentile(latencies, 0.95) if latencies else None,
+                'last_success': record['last_success'],
+                'consecutive_failures': record['consecutive_failures'],
+                'samples': len(results),
+            }
+
+    # 提交顺序的排序键：正常的源在前，其中耗时长的先开始；成功率低于一半的源和试探请求排在最后
+    def priority(self, url, now=None):
+        stats = self.stats(url, now)
+        if not stats:
+            return (False, False, 0)
+        unhealthy = stats['success_rate'] is not None and stats['success_rate'] < 0.5
+        return (stats['state'] == HALF_OPEN, unhealthy, -(stats['p95'] or 0))
+
+    # 各源（urls 为None时为全部有记录的源）的健康统计，以及熔断中和等待试探的源数量（写入运行指标）
+    def summary(self, urls=None, now=None):
+        with self._lock:
+            urls = [url for url in (urls or list(self._records())) if url in self._records()]
+        sources = {url: self.stats(url, now) for url in urls}
+        return {
+            'open': sum(1 for stats in sources.values() if stats['state'] == OPEN),
+            'half_open': sum(1 for stats in sources.values() if stats['state'] == HALF_OPEN),
+            'sources': sources,
+        }
+
+    def save(self):
+        with self._lock:
+            if self._sources is None:
+                return
+            data = {'sources': self._sources}
+            try:
+                local_cache.write_json_atomic(self.path, data)
+            except OSError:
+                pass
@@ -1,16 +1,24 @@
 # 安装依赖 pip3 install requests html5lib bs4 schedule yfinance
+# newspaper、feedparser、requests（见http_client）、openai 以及股票分析模块（yfinance/pandas）均在首次使用时才导入，以加快启动
 import os
-import requests
-import json
-from openai import OpenAI
-import feedparser
-from newspaper import Article
+import argparse
 from datetime import datetime, timedelta
 import time
 import pytz
-import re
-import yfinance as yf
-import sector_stock_analysis
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import local_cache
+import http_client
+import wechat_client
+import llm_utils
+import stage_runner
+import page_template
+import run_metrics
+import retry_policy
+import feed_health
+from markdown_render import convert_markdown_to_html, IncrementalMarkdownRenderer
+from news_dedup import ArticleDeduplicator
 
 # 从环境变量获取微信公众号配置
 appID = os.environ.get("APP_ID")
@@ -18,30 +26,6 @@ appSecret = os.environ.get("APP_SECRET")
 openId = os.environ.get("OPEN_ID")
 template_id = os.environ.get("TEMPLATE_ID")
 
-# 选择使用的AI服务 (deepseek 或 alimind)
-ai_service = os.environ.get("AI_SERVICE", "deepseek")
-
-if ai_service == "deepseek":
-    # DeepSeek API Key
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("环境变量 DEEPSEEK_API_KEY 未设置!")
-    api_base_url = "https://api.deepseek.com/v1"
-    model_name = "deepseek-chat"
-elif ai_service == "alimind":
-    # 阿里千文API配置
-    api_key = os.environ.get("ALI_MIND_API_KEY")
-    if not api_key:
-        raise ValueError("环境变量 ALI_MIND_API_KEY 未设置!")
-    api_base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # 阿里千文兼容OpenAI接口的地址
-    model_name = "qwen-turbo"  # 阿里千文模型名称
-else:
-    raise ValueError(f"不支持的AI服务类型: {ai_service}")
-
-# 初始化OpenAI客户端
-openai_client = OpenAI(api_key=api_key, base_url=api_base_url)
-print(f"使用AI服务: {ai_service}, 模型: {model_name}")
-
 # RSS源地址列表
 rss_feeds = {
     "💲 华尔街见闻":{
@@ -70,6 +54,74 @@ rss_feeds = {
     },
 }
 
+# RSS并发抓取配置（全局并发数与单个主机的并发上限，可通过环境变量调整）
+RSS_MAX_WORKERS = int(os.environ.get("RSS_MAX_WORKERS", "8"))
+RSS_PER_HOST_LIMIT = int(os.environ.get("RSS_PER_HOST_LIMIT", "2"))
+
+# 文章正文下载配置（下载线程数与单个域名的并发上限）
+ARTICLE_MAX_WORKERS = int(os.environ.get("ARTICLE_MAX_WORKERS", "8"))
+ARTICLE_PER_HOST_LIMIT = int(os.environ.get("ARTICLE_PER_HOST_LIMIT", "2"))
+
+# RSS和文章正文的重试策略（最多尝试次数、单次超时、退避基数，均受 RUN_DEADLINE 限制）
+# FEED_HEDGE_AFTER 大于0时，RSS请求超过该秒数未返回会再并行请求一次，取先返回的结果
+feed_retry_policy = retry_policy.RetryPolicy(
+    'feed',
+    attempts=int(os.environ.get("FEED_RETRIES", "3")),
+    timeout=float(os.environ.get("FEED_TIMEOUT", "15")),
+    backoff=float(os.environ.get("FEED_BACKOFF", "2")),
+    hedge_after=float(os.environ.get("FEED_HEDGE_AFTER", "0")) or None,
+)
+# 熔断后的试探请求只尝试一次
+feed_probe_policy = retry_policy.RetryPolicy('feed_probe', attempts=1, timeout=feed_retry_policy.timeout)
+article_retry_policy = retry_policy.RetryPolicy(
+    'article',
+    attempts=int(os.environ.get("ARTICLE_RETRIES", "2")),
+    timeout=float(os.environ.get("ARTICLE_TIMEOUT", "15")),
+    backoff=float(os.environ.get("ARTICLE_BACKOFF", "1")),
+)
+
+# 摘要token预算：不超过单次预算时直接摘要，否则按分片预算并行摘要后汇总；总预算限制送入模型的正文总量
+# 单次预算按模型上下文窗口（约128k）减去提示词和输出的余量设置，日常约6万token的正文一次完成摘要，
+# 只有源数量或文章数明显增多的批次才会分片
+SUMMARY_SINGLE_PASS_TOKENS = int(os.environ.get("SUMMARY_SINGLE_PASS_TOKENS", "96000"))
+SUMMARY_CHUNK_TOKENS = int(os.environ.get("SUMMARY_CHUNK_TOKENS", "48000"))
+SUMMARY_TOTAL_TOKENS = int(os.environ.get("SUMMARY_TOTAL_TOKENS", "192000"))
+SUMMARY_MAX_WORKERS = int(os.environ.get("SUMMARY_MAX_WORKERS", "4"))
+
+# 模板消息群发配置：每秒发送上限与并发数
+WECHAT_SEND_RATE = float(os.environ.get("WECHAT_SEND_RATE", "20"))
+WECHAT_SEND_WORKERS = int(os.environ.get("WECHAT_SEND_WORKERS", "8"))
+
+# 流式接收大模型输出，边生成边转换HTML（LLM_STREAM=0 时等待完整结果）
+LLM_STREAM = os.environ.get("LLM_STREAM", "1") == "1"
+# 摘要页面中的“- ”/“1. ”开头的行转换为HTML列表（默认关闭，保持原有的逐行显示）
+MARKDOWN_LISTS = os.environ.get("MARKDOWN_LISTS", "0") == "1"
+
+# 微信access_token管理（本地缓存，过期前5分钟刷新）
+token_manager = wechat_client.AccessTokenManager(appID or "", appSecret or "")
+
+# RSS条件请求缓存（ETag / Last-Modified）
+feed_cache = local_cache.FeedCache()
+
+# RSS源健康记录与熔断：连续失败 FEED_BREAKER_FAILURES 次后暂停请求，冷却 FEED_BREAKER_COOLDOWN 小时后试探一次
+source_health = feed_health.FeedHealth(
+    failure_threshold=int(os.environ.get("FEED_BREAKER_FAILURES", "3")),
+    cooldown=float(os.environ.get("FEED_BREAKER_COOLDOWN", "12")) * 3600,
+)
+
+# 已推送条目索引（保留期限单位为天），推送成功后记录本次推送的条目
+seen_index = local_cache.SeenIndex(retention=int(os.environ.get("SEEN_RETENTION_DAYS", "14")) * 24 * 3600)
+
+# NEWS_ONLY_NEW=1 时只下载和摘要上次推送之后的新条目，新条目不足 NEWS_MIN_BATCH 条时用已推送的条目补足
+NEWS_ONLY_NEW = os.environ.get("NEWS_ONLY_NEW", "0") == "1"
+NEWS_MIN_BATCH = int(os.environ.get("NEWS_MIN_BATCH", "10"))
+
+# 文章正文缓存（过期时间单位为秒，超过条目上限时淘汰最久未访问的文章）
+article_cache = local_cache.ArticleCache(
+    ttl=int(os.environ.get("ARTICLE_CACHE_TTL", str(3 * 24 * 3600))),
+    max_entries=int(os.environ.get("ARTICLE_CACHE_MAX_ENTRIES", "2000")),
+)
+
 # 获取北京时间
 def today_date():
     return datetime.now(pytz.timezone("Asia/Shanghai")).date()
@@ -84,82 +136,248 @@ def get_time_period():
     else:
         return "晚间"
 
-# 爬取网页正文 (用于 AI 分析)
+# 爬取网页正文 (用于 AI 分析)，优先读取本地正文缓存
 def fetch_article_text(url):
+    cached_text = article_cache.get_text(url)
+    if cached_text is not None:
+        run_metrics.incr('article.cache_hits')
+        return cached_text
+
     try:
+        from newspaper import Article
+        from newspaper.network import get_html_2XX_only
         # 移除爬取文章开始的打印
-        article = Article(url)
-        article.download()
-        article.parse()
+        # 通过共享连接池下载网页，再交给newspaper按其规则识别编码并解析
+        def download(timeout):
+            response = http_client.get(url, timeout=timeout)
+            response.raise_for_status()
+            return response
+
+        with run_metrics.span('article.download'):
+            response = article_retry_policy.call(download)
+        run_metrics.incr('article.bytes', len(response.content))
+        with run_metrics.span('article.parse'):
+            article = Article(url)
+            article.download(input_html=get_html_2XX_only(url, article.config, response=response))
+            article.parse()
         text = article.text[:1500]  # 限制长度，防止超出 API 输入限制
         if not text:
             # 移除内容为空的打印
             pass
+        else:
+            article_cache.set_text(url, text)
         return text
     except Exception as e:
         # 移除爬取失败的打印
+        run_metrics.incr('article.failures')
         return "（未能获取文章正文）"
 
-# 添加 User-Agent 头
-def fetch_feed_with_headers(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    return feedparser.parse(url, request_headers=headers)
+# 通过共享连接池获取RSS，并带上缓存的ETag/Last-Modified发起条件请求
+def fetch_feed_with_headers(url, timeout=None):
+    import feedparser
+    headers = {}
+    cached = feed_cache.load(url)
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('modified'):
+            headers['If-Modified-Since'] = cached['modified']
+
+    response = http_client.get(url, headers=headers, timeout=timeout)
+    run_metrics.incr('feed.bytes', len(response.content))
+    if response.status_code == 304 and cached:
+        # 源未更新，直接使用缓存的条目
+        run_metrics.incr('feed.not_modified')
+        return feedparser.FeedParserDict(
+            status=304,
+            entries=[feedparser.FeedParserDict(entry) for entry in cached['entries']],
+        )
 
-# 自动重试获取 RSS
-def fetch_feed_with_retry(url, retries=3, delay=5):
-    for i in range(retries):
+    # 把响应头交给feedparser，用于识别编码和解析相对链接
+    response_headers = {key.lower(): value for key, value in response.headers.items()}
+    response_headers.setdefault('content-location', response.url)
+    feed = feedparser.parse(response.content, response_headers=response_headers)
+    feed['status'] = response.status_code
+
+    if response.status_code == 200 and feed.entries:
+        feed_cache.save(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), feed.entries)
+    return feed
+
+# RSS没有条目时也重试（4xx除外），与请求异常一样按退避时间等待后再试
+def _feed_needs_retry(feed):
+    return not feed.entries and retry_policy.is_retryable_status(feed.get('status'))
+
+# 自动重试获取 RSS（重试次数、超时、退避和对冲见 feed_retry_policy）
+def fetch_feed_with_retry(url, policy=None):
+    with run_metrics.span('feed.fetch'):
         try:
-            feed = fetch_feed_with_headers(url)
-            if feed and hasattr(feed, 'entries') and len(feed.entries) > 0:
+            feed = (policy or feed_retry_policy).call(
+                lambda timeout: fetch_feed_with_headers(url, timeout), retry_result=_feed_needs_retry)
+            if feed.entries:
                 return feed
-        except Exception as e:
-            # 移除失败重试的打印
-            time.sleep(delay)
-    # 移除最终失败的打印
-    return None
+        except Exception:
+            # 移除最终失败的打印
+            pass
+        run_metrics.incr('feed.failures')
+        return None
+
+# 获取RSS并记录该源的健康状况（成功与否和总耗时），probe=True 表示熔断后的试探请求
+def fetch_feed_tracked(url, probe=False):
+    start = time.perf_counter()
+    feed = fetch_feed_with_retry(url, feed_probe_policy if probe else None)
+    source_health.record(url, feed is not None, time.perf_counter() - start)
+    return feed
+
+# 按主机限制并发数，避免同一站点同时收到过多请求
+class HostLimiter:
+    def __init__(self, per_host_limit):
+        self.per_host_limit = max(1, per_host_limit)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, url):
+        host = urlparse(url).hostname or ""
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+    def run(self, url, func, *args, **kwargs):
+        with self._semaphore(url):
+            return func(*args, **kwargs)
+
+# 展开RSS配置为 (分类, 来源, 地址) 列表，顺序与rss_feeds配置一致
+def feed_jobs(rss_feeds):
+    return [(category, source, url)
+            for category, sources in rss_feeds.items()
+            for source, url in sources.items()]
+
+# 并发获取RSS源，按完成先后依次产出 (序号, feed)
+# 熔断中的源不再请求，直接产出None；其余按 source_health 的优先级提交，持续失败的源和试探请求排在最后
+def iter_feeds_as_completed(jobs, max_workers=RSS_MAX_WORKERS, per_host_limit=RSS_PER_HOST_LIMIT):
+    if not jobs:
+        return
+
+    states = [source_health.state(url) for _, _, url in jobs]
+    for index, state in enumerate(states):
+        if state == feed_health.OPEN:
+            run_metrics.incr('feed.circuit_skipped')
+            yield index, None
+    order = sorted((index for index, state in enumerate(states) if state != feed_health.OPEN),
+                   key=lambda index: source_health.priority(jobs[index][2]))
+    if order:
+        limiter = HostLimiter(per_host_limit)
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(order)))) as pool:
+            futures = {}
+            for index in order:
+                url = jobs[index][2]
+                probe = states[index] == feed_health.HALF_OPEN
+                if probe:
+                    run_metrics.incr('feed.circuit_probes')
+                futures[pool.submit(limiter.run, url, fetch_feed_tracked, url, probe)] = index
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    source_health.save()
 
 # 获取RSS内容（爬取正文用于分析）
-def fetch_rss_articles(rss_feeds, max_articles=5):
-    news_data = {}
+# stats 传入字典时写入去重统计（重复条数、节省的下载次数和提示词字符数）以及本次选用条目的标识（entry_keys）
+# only_new=True 时跳过 seen_index 中已推送过的条目；全部RSS源到达后新条目不足 min_batch 条时，
+# 按配置顺序从各源轮流补充已推送过的条目
+def fetch_rss_articles(rss_feeds, max_articles=5, stats=None, seen_index=None, only_new=False, min_batch=0):
+    news_data = {category: "" for category in rss_feeds}
     analysis_text = ""  # 用于AI分析的正文内容
 
-    for category, sources in rss_feeds.items():
-        category_content = ""
-        for source, url in sources.items():
-            # 移除RSS获取开始的打印
-            feed = fetch_feed_with_retry(url)
+    jobs = feed_jobs(rss_feeds)
+    # 每个源的候选条目 [标题, 链接, 条目标识, 正文下载任务]，已推送过而暂缓下载的条目任务为None
+    feed_entries = [None] * len(jobs)
+    article_limiter = HostLimiter(ARTICLE_PER_HOST_LIMIT)
+    deduplicator = ArticleDeduplicator()
+    fetches_saved = 0
+    prompt_chars_saved = 0
+    new_entries = 0
+    topped_up = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, ARTICLE_MAX_WORKERS)) as article_pool:
+        # 提交正文下载任务，重复文章（同一URL或近似标题）复用已提交的下载任务
+        def submit(entry):
+            nonlocal fetches_saved
+            title, link = entry[0], entry[1]
+            future = deduplicator.find(link, title)
+            if future is None:
+                # 爬取正文用于分析
+                future = article_pool.submit(article_limiter.run, link, fetch_article_text, link)
+                deduplicator.add(link, title, future)
+            else:
+                fetches_saved += 1
+            entry[3] = future
+
+        # 每个RSS源一到达就提交其正文下载任务，与其余RSS源的获取同时进行
+        for index, feed in iter_feeds_as_completed(jobs):
             if not feed:
                 # 移除RSS获取失败的打印
                 continue
             # 移除RSS获取成功的打印
 
-            articles = []  # 每个source都需要重新初始化列表
-            for entry in feed.entries[:5]:
-                title = entry.get('title', '无标题')
-                link = entry.get('link', '') or entry.get('guid', '')
+            entries = []
+            for item in feed.entries[:max_articles]:
+                title = item.get('title', '无标题')
+                link = item.get('link', '') or item.get('guid', '')
                 if not link:
                     # 移除无链接跳过的打印
                     continue
 
-                # 爬取正文用于分析
-                article_text = fetch_article_text(link)
-                analysis_text += f"【{title}】\n{article_text}\n\n"
+                entry = [title, link, local_cache.SeenIndex.entry_key(item), None]
+                if not (only_new and seen_index is not None and seen_index.contains(entry[2])):
+                    submit(entry)
+                    new_entries += 1
+                entries.append(entry)
+            feed_entries[index] = entries
+
+        # 新条目不足最小批量时，从各源轮流补充已推送过的条目
+        deferred = [[entry for entry in entries if entry[3] is None] for entries in feed_entries if entries]
+        while new_entries + topped_up < min_batch and any(deferred):
+            for entries in deferred:
+                if entries and new_entries + topped_up < min_batch:
+                    submit(entries.pop(0))
+                    topped_up += 1
+
+        # 按配置顺序把正文结果拼回对应条目，重复文章的正文只保留第一次出现
+        included = set()
+        entry_keys = []
+        for (category, source, _), entries in zip(jobs, feed_entries):
+            entries = [entry for entry in entries or () if entry[3] is not None]
+            if not entries:
+                continue
 
+            articles = []  # 每个source都需要重新初始化列表
+            for title, link, key, future in entries:
+                block = f"【{title}】\n{future.result()}\n\n"
+                if id(future) in included:
+                    prompt_chars_saved += len(block)
+                else:
+                    included.add(id(future))
+                    analysis_text += block
                 # 移除单条新闻获取成功的打印
                 articles.append(f"[{title}]({link})")
+                entry_keys.append(key)
 
-            if articles:
-                category_content += f"### {source}\n" + "\n".join(articles) + "\n\n"
-
-        news_data[category] = category_content
+            news_data[category] += f"### {source}\n" + "\n".join(articles) + "\n\n"
 
+    if stats is not None:
+        stats.update({
+            'duplicates': deduplicator.duplicates,
+            'fetches_saved': fetches_saved,
+            'prompt_chars_saved': prompt_chars_saved,
+            'new_entries': new_entries,
+            'topped_up': topped_up,
+            'entry_keys': entry_keys,
+        })
     return news_data, analysis_text
 
 # AI 生成内容摘要（基于爬取的正文）
 # 生成完整新闻摘要HTML文件
-def generate_summary_html(summary_text):
+# finance_html / stock_analysis_html 为流式生成时已转换好的两部分HTML，传入时不再重复转换
+def generate_summary_html(summary_text, finance_html=None, stock_analysis_html=None):
     # 使用固定文件名在同层级生成HTML，便于GitHub Pages访问
     html_filename = 'finance_summary.html'
     
@@ -169,335 +387,67 @@ def generate_summary_html(summary_text):
     # 获取时间戳，用于防止缓存
     timestamp = int(time.time())
     
-    # 分割内容为财经要点和板块股票分析两部分
-    # 查找板块与股票分析的分隔符
-    section_split_pos = summary_text.find("## 📊 板块与股票分析")
-    
-    # 提取两部分内容
-    if section_split_pos != -1:
-        finance_content = summary_text[:section_split_pos]
-        stock_analysis_content = summary_text[section_split_pos:]
-    else:
-        # 如果没有找到分隔符，全部内容放入财经要点
-        finance_content = summary_text
-        stock_analysis_content = ""
-    
-    # 转换标题函数
-    def convert_markdown_to_html(content):
-        formatted = content
-        
-        # 转换标题
-        formatted = formatted.replace('\n# ', '\n<h1>')
-        formatted = formatted.replace('\n## ', '\n<h2>')
-        formatted = formatted.replace('\n### ', '\n<h3>')
-        formatted = formatted.replace('\n#### ', '\n<h4>')
-        
-        # 处理标题结束标签
-        for level in range(4, 0, -1):
-            formatted = re.sub(
-                r'<h{level}>(.*?)(?=\n<h|\Z)'.format(level=level), 
-                r'<h{level}>\1</h{level}>'.format(level=level), 
-                formatted, 
-                flags=re.DOTALL
-            )
-        
-        # 转换粗体文本
-        formatted = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', formatted)
-        
-        # 转换链接
-        formatted = re.sub(r'\[(.*?)\]\(((?:[^()]|\((?:[^()]|\([^()]*\))*\))*)\)', r'<a href="\2">\1</a>', formatted)
-        
-        # 转义换行符为HTML<br>标签
-        formatted = formatted.replace('\n', '<br>')
-        
-        return formatted
+    # 流式生成时两部分已经边接收边转换好，直接使用
+    if finance_html is None or stock_analysis_html is None:
+        # 分割内容为财经要点和板块股票分析两部分
+        # 查找板块与股票分析的分隔符
+        section_split_pos = summary_text.find("## 📊 板块与股票分析")
+
+        # 提取两部分内容
+        if section_split_pos != -1:
+            finance_content = summary_text[:section_split_pos]
+            stock_analysis_content = summary_text[section_split_pos:]
+        else:
+            # 如果没有找到分隔符，全部内容放入财经要点
+            finance_content = summary_text
+            stock_analysis_content = ""
+
+        # 转换两部分内容
+        finance_html = convert_markdown_to_html(finance_content, MARKDOWN_LISTS)
+        stock_analysis_html = convert_markdown_to_html(stock_analysis_content, MARKDOWN_LISTS)
     
-    # 转换两部分内容
-    finance_html = convert_markdown_to_html(finance_content)
-    stock_analysis_html = convert_markdown_to_html(stock_analysis_content)
+    # 样式和脚本写入带内容哈希的静态文件，页面只包含本次生成的内容
+    hrefs = page_template.write_static_assets(os.path.dirname(html_filename) or ".")
+    html_content = page_template.render_page(finance_html, stock_analysis_html, current_time, timestamp, hrefs)
     
-    # 生成HTML内容，包含Tab切换功能
-    html_content = f'''
-    <!DOCTYPE html>
-    <html lang="zh-CN">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <meta name="format-detection" content="telephone=no">
-        <meta name="apple-mobile-web-app-capable" content="yes">
-        <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">
-        <meta http-equiv="Pragma" content="no-cache">
-        <meta http-equiv="Expires" content="0">
-        <title>财经新闻速递</title>
-        <style>
-            /* 安全区域样式重置 */
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            
-            /* 基础样式 */
-            body {{
-                font-family: -apple-system, BlinkMacSystemFont, 'PingFang SC', 'Microsoft YaHei', Arial, sans-serif;
-                line-height: 1.7;
-                color: #333;
-                max-width: 100%;
-                margin: 0;
-                padding: 0;
-                background-color: #f8f8f8;
-                -webkit-text-size-adjust: 100%;
-                -webkit-tap-highlight-color: transparent;
-            }}
-            
-            /* 容器样式 */
-            .container {{
-                max-width: 800px;
-                margin: 0 auto;
-                padding: 20px 15px;
-                background-color: #fff;
-                min-height: 100vh;
-            }}
-            
-            /* 标题样式 */
-            h1, h2, h3, h4 {{
-                color: #2c3e50;
-                margin: 15px 0 10px 0;
-                line-height: 1.4;
-            }}
-            
-            h1 {{
-                font-size: 22px;
-                padding-bottom: 10px;
-                border-bottom: 1px solid #eee;
-            }}
-            h2 {{
-                font-size: 20px;
-            }}
-            h3 {{
-                font-size: 18px;
-            }}
-            h4 {{
-                font-size: 16px;
-                color: #555;
-            }}
-            
-            /* 粗体样式 */
-            strong {{
-                color: #e74c3c;
-                font-weight: 600;
-            }}
-            
-            /* 链接样式 */
-            a {{
-                color: #3498db;
-                text-decoration: none;
-                border-bottom: 1px solid #3498db;
-            }}
-            
-            a:hover {{
-                text-decoration: underline;
-            }}
-            
-            /* 内容样式 */
-            .summary-content {{
-                background: white;
-                padding: 0;
-            }}
-            .summary-meta {{
-                color: #666;
-                font-size: 14px;
-                margin-bottom: 15px;
-                padding-bottom: 15px;
-                border-bottom: 1px solid #eee;
-            }}
-            
-            .summary-body {{
-                font-size: 16px;
-                color: #333;
-            }}
-            
-            /* 段落样式 */
-            .summary-body > div {{
-                margin-bottom: 15px;
-            }}
-            
-            /* Tab样式 */
-            .tab-container {{
-                margin-top: 20px;
-                border: 1px solid #e0e0e0;
-                border-radius: 8px;
-                overflow: hidden;
-                box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-            }}
-            
-            .tab-headers {{
-                display: flex;
-                background-color: #f8f8f8;
-                border-bottom: 1px solid #e0e0e0;
-            }}
-            
-            .tab-header {{
-                flex: 1;
-                padding: 15px 20px;
-                text-align: center;
-                cursor: pointer;
-                transition: all 0.3s ease;
-                font-weight: 600;
-                color: #666;
-                border-bottom: 3px solid transparent;
-            }}
-            
-            .tab-header:hover {{
-                background-color: #f0f0f0;
-                color: #3498db;
-            }}
-            
-            .tab-header.active {{
-                background-color: #fff;
-                color: #3498db;
-                border-bottom-color: #3498db;
-            }}
-            
-            .tab-content {{
-                padding: 20px;
-                display: none;
-            }}
-            
-            .tab-content.active {{
-                display: block;
-            }}
-            
-            /* 响应式设计 */
-            @media (max-width: 480px) {{
-                .container {{
-                    padding: 15px 12px;
-                }}
-                
-                h1 {{
-                    font-size: 20px;
-                }}
-                h2 {{
-                    font-size: 18px;
-                }}
-                h3 {{
-                    font-size: 16px;
-                }}
-                h4 {{
-                    font-size: 15px;
-                }}
-                
-                .summary-body {{
-                    font-size: 15px;
-                }}
-                
-                .tab-header {{
-                    padding: 12px 10px;
-                    font-size: 14px;
-                }}
-                
-                .tab-content {{
-                    padding: 15px 10px;
-                }}
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="summary-content">
-                <h1>财经新闻速递</h1>
-                <div class="summary-meta">生成时间: {current_time} (版本: {timestamp})</div>
-                
-                <!-- Tab容器 -->
-                <div class="tab-container">
-                    <!-- Tab头部 -->
-                    <div class="tab-headers">
-                        <div class="tab-header active" onclick="switchTab('finance')">财经要点摘要</div>
-                        <div class="tab-header" onclick="switchTab('stocks')">板块与股票分析</div>
-                    </div>
-                    
-                    <!-- Tab内容 -->
-                    <div id="finance" class="tab-content active summary-body">
-                        {finance_html}
-                    </div>
-                    <div id="stocks" class="tab-content summary-body">
-                        {stock_analysis_html}
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <script>
-            // Tab切换功能
-            function switchTab(tabId) {{
-                // 隐藏所有内容，移除所有活动状态
-                const contents = document.querySelectorAll('.tab-content');
-                const headers = document.querySelectorAll('.tab-header');
-                
-                contents.forEach(content => content.classList.remove('active'));
-                headers.forEach(header => header.classList.remove('active'));
-                
-                // 显示选中内容，添加活动状态
-                document.getElementById(tabId).classList.add('active');
-                document.querySelector(`[onclick="switchTab('${{tabId}}')"]`).classList.add('active');
-                
-                // 滚动到顶部
-                window.scrollTo({{
-                    top: 0,
-                    behavior: 'smooth'
-                }});
-            }}
-            
-            // 简单的兼容性脚本
-            document.addEventListener('DOMContentLoaded', function() {{
-                // 处理iOS Safari上的滚动问题
-                document.body.style.webkitOverflowScrolling = 'touch';
-                
-                // 防止缓存
-                window.onpageshow = function(event) {{
-                    if (event.persisted) {{
-                        window.location.reload();
-                    }}
-                }};
-            }});
-        </script>
-    </body>
-    </html>
-    '''
-    
-    # 写入文件
-    with open(html_filename, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    # 写入文件（同时生成预压缩的 .gz 文件）
+    page_template.write_with_gzip(html_filename, html_content)
     
     # 返回文件的相对路径
     return html_filename
 
+# 财经摘要的系统提示词（单次摘要和分片汇总共用）
+SUMMARY_SYSTEM_PROMPT = "你是一位经验丰富、逻辑严谨的财经新闻分析师，服务对象为券商分析师、基金经理、金融研究员、宏观策略师等专业人士。请基于以下财经新闻原文内容，完成高质量的内容理解与结构化总结，形成一份专业、精准、清晰的财经要点摘要，用于支持机构投资者的日常研判工作。【输出要求】1.全文控制在 2000 字以内，内容精炼、逻辑清晰；2.从宏观政策、金融市场、行业动态、公司事件、风险提示等角度进行分类总结；3.每一部分要突出数据支持、趋势研判、可能的市场影响；4.明确指出新闻背后的核心变量或政策意图，并提出投资视角下的参考意义；5.语气专业、严谨、无情绪化表达，适配专业机构投研阅读习惯；6.禁止套话，不重复新闻原文，可用条列式增强结构性；7.如涉及数据和预测，请标注来源或指出主张机构（如高盛、花旗等）；8.若原文较多内容无关财经市场，可酌情略去，只保留关键影响要素。"
+
+# 分片摘要阶段的系统提示词：把部分新闻压缩为要点笔记，供最终汇总使用
+CHUNK_SYSTEM_PROMPT = "你是一位财经新闻分析师。请将以下多篇财经新闻原文压缩为要点笔记，每篇保留关键数据、政策信息、机构观点和可能的市场影响，不超过3条要点，不做评论、不加套话，供后续汇总分析使用。"
+
+# 调用大模型（带回复缓存）并记录该阶段的token用量
+def _chat(system_prompt, content, usage=None, stage="single", on_text=None):
+    return llm_utils.chat_completion(None, None, system_prompt, content, usage, stage, on_text=on_text)
+
 # AI 生成内容摘要（基于爬取的正文）
-def summarize(text):
-    completion = openai_client.chat.completions.create(
-        model=model_name, 
-        messages=[
-            {"role": "system", "content":"你是一位经验丰富、逻辑严谨的财经新闻分析师，服务对象为券商分析师、基金经理、金融研究员、宏观策略师等专业人士。请基于以下财经新闻原文内容，完成高质量的内容理解与结构化总结，形成一份专业、精准、清晰的财经要点摘要，用于支持机构投资者的日常研判工作。【输出要求】1.全文控制在 2000 字以内，内容精炼、逻辑清晰；2.从宏观政策、金融市场、行业动态、公司事件、风险提示等角度进行分类总结；3.每一部分要突出数据支持、趋势研判、可能的市场影响；4.明确指出新闻背后的核心变量或政策意图，并提出投资视角下的参考意义；5.语气专业、严谨、无情绪化表达，适配专业机构投研阅读习惯；6.禁止套话，不重复新闻原文，可用条列式增强结构性；7.如涉及数据和预测，请标注来源或指出主张机构（如高盛、花旗等）；8.若原文较多内容无关财经市场，可酌情略去，只保留关键影响要素。"},
-            {"role": "user", "content": text}
-        ]
-    )
-    return completion.choices[0].message.content.strip()
-
-# 获取微信公众号access_token
-def get_access_token():
-    # 获取access token的url
-    url = 'https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={}&secret={}' \
-        .format(appID.strip(), appSecret.strip())
-    response = requests.get(url).json()
-    # 移除响应打印
-    access_token = response.get('access_token')
-    return access_token
-
-# 发送财经新闻到微信
-def send_news_to_wechat(access_token, news_content, summary_html_path):
+# 正文超过单次预算时先按分片并行摘要（map），再对分片要点做一次汇总（reduce）
+# usage 传入字典时按阶段记录调用次数和token用量；on_text 用于流式接收最终摘要（分片摘要不流式输出）
+@run_metrics.timed('llm.summarize')
+def summarize(text, usage=None, on_text=None):
+    text = llm_utils.fit_to_budget(text, SUMMARY_TOTAL_TOKENS)
+    if llm_utils.estimate_tokens(text) <= SUMMARY_SINGLE_PASS_TOKENS:
+        return _chat(SUMMARY_SYSTEM_PROMPT, text, usage, "single", on_text)
+
+    chunks = llm_utils.split_by_token_budget(llm_utils.split_article_blocks(text), SUMMARY_CHUNK_TOKENS)
+    with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_MAX_WORKERS, len(chunks)))) as pool:
+        notes = list(pool.map(lambda chunk: _chat(CHUNK_SYSTEM_PROMPT, chunk, usage, "map"), chunks))
+    return _chat(SUMMARY_SYSTEM_PROMPT, "\n\n".join(notes), usage, "reduce", on_text)
+
+# 获取微信公众号access_token（优先使用本地缓存的未过期token）
+def get_access_token(force_refresh=False):
+    return token_manager.get_token(force_refresh)
+
+# 组织财经新闻模板消息（不含touser，发送时按接收人填入）
+def build_template_body(news_content):
     # 删除调试信息
     
-    # touser 就是 openID
     # template_id 就是模板ID
     # url 就是点击模板跳转的url
     # data按模板格式组织
@@ -529,8 +479,7 @@ def send_news_to_wechat(access_token, news_content, summary_html_path):
             base_url = f"https://{parts[0]}.github.io/{parts[1]}/finance_summary.html"
             github_pages_url = f"{base_url}?t={timestamp}"
     
-    body = {
-        "touser": openId.strip(),
+    return {
         "template_id": template_id.strip(),
         "url": github_pages_url,  # 使用GitHub Pages URL作为跳转链接
         "data": {
@@ -545,74 +494,187 @@ def send_news_to_wechat(access_token, news_content, summary_html_path):
             }
         }
     }
-    
-    
-    url = 'https://api.weixin.qq.com/cgi-bin/message/template/send?access_token={}'.format(access_token)
-    response = requests.post(url, json.dumps(body))
-    # 移除响应状态打印
-    return response.json()
+
+# 并发推送财经新闻给所有订阅用户，返回发送汇总
+def broadcast_news_to_wechat(news_content, summary_html_path, recipients):
+    return wechat_client.send_template_messages(
+        token_manager, build_template_body(news_content), recipients,
+        rate=WECHAT_SEND_RATE, max_workers=WECHAT_SEND_WORKERS,
+    )
 
 
 
 # 主函数
-def news_report():
+# 各阶段按依赖关系并发执行：股票分析与RSS获取、AI摘要同时进行，access_token在调用大模型期间获取
+# 返回各阶段的结果和耗时（见 stage_runner.run_stages），便于基准测试等调用方统计
+# stage_wrapper 和 max_workers 传给 stage_runner.run_stages，性能分析模式下用于包装各阶段并依次执行
+def news_report(stage_wrapper=None, max_workers=None):
     # 获取当前日期和时间段
     today = today_date()
     time_period = get_time_period()
+    today_str = today.strftime("%Y-%m-%d")
     print(f"🔄 开始生成{time_period}财经新闻推送，日期: {today}")
+    # 启动时先检查AI服务配置，配置错误时立即报错（此处不会导入openai）
+    llm_utils.get_ai_config()
+    # 各缓存的命中统计，运行结束后随指标一起写入 run_metrics.json
+    cache_stats = {}
+    # 流式模式下摘要和股票分析边生成边转换为HTML，两部分各用一个增量转换器
+    renderers = {'summary': IncrementalMarkdownRenderer(MARKDOWN_LISTS), 'stock': IncrementalMarkdownRenderer(MARKDOWN_LISTS)}
     
     # 1. 获取RSS文章
-    print("🔄 正在获取RSS文章...")
-    articles_data, analysis_text = fetch_rss_articles(rss_feeds, max_articles=5)
-    print(f"✅ 文章获取完成")
-    print(f"   文章分类数量: {len(articles_data)}")
-    print(f"   文章类别: {list(articles_data.keys())}")
+    def fetch_articles_stage(inputs):
+        print("🔄 正在获取RSS文章...")
+        dedup_stats = {}
+        articles_data, analysis_text = fetch_rss_articles(
+            rss_feeds, max_articles=5, stats=dedup_stats,
+            seen_index=seen_index, only_new=NEWS_ONLY_NEW, min_batch=NEWS_MIN_BATCH)
+        print(f"✅ 文章获取完成")
+        print(f"   文章分类数量: {len(articles_data)}")
+        print(f"   文章类别: {list(articles_data.keys())}")
+        print(f"   重复文章: {dedup_stats['duplicates']}, 节省下载: {dedup_stats['fetches_saved']}次, "
+              f"节省提示词: {dedup_stats['prompt_chars_saved']}字符")
+        if NEWS_ONLY_NEW:
+            print(f"   新条目: {dedup_stats['new_entries']}, 补充已推送条目: {dedup_stats['topped_up']}")
+        health = source_health.summary([url for _, _, url in feed_jobs(rss_feeds)])
+        print(f"   RSS源熔断中: {health['open']}个, 等待试探: {health['half_open']}个")
+        cache_stats['articles'] = article_cache.stats()
+        print(f"   正文缓存命中: {cache_stats['articles']['hits']}, 未命中: {cache_stats['articles']['misses']}")
+        return articles_data, analysis_text, dedup_stats['entry_keys']
     
     # 2. 使用AI生成财经新闻摘要
-    today_str = today.strftime("%Y-%m-%d")
-    final_summary = ""
+    def summary_stage(inputs):
+        _, analysis_text, _ = inputs['articles']
+        header = f"📅 **{today_str} 财经新闻每日速递**\n\n✍️ **今日分析总结：**\n"
+        renderer = renderers['summary']
+        renderer.feed(header)
+        try:
+            print("🧠 正在生成AI财经摘要...")
+            summary_usage = {}
+            ai_summary = summarize(analysis_text, usage=summary_usage, on_text=renderer.feed if LLM_STREAM else None)
+            print(f"✅ AI摘要生成完成，长度: {len(ai_summary)}字符")
+            for stage, stage_usage in summary_usage.items():
+                print(f"   {stage}阶段: 调用{stage_usage['calls']}次(缓存命中{stage_usage['cached_calls']}次), "
+                      f"输入{stage_usage['prompt_tokens']} tokens, "
+                      f"输出{stage_usage['completion_tokens']} tokens")
+            summary = f"{header}{ai_summary}\n\n---\n\n"
+        except Exception as e:
+            print(f"❌ AI摘要生成失败: {str(e)}")
+            summary = f"{header}AI摘要生成失败，请查看系统日志获取详细信息\n\n---\n\n"
+        if summary.startswith(renderer.source):
+            renderer.feed(summary[len(renderer.source):])
+        return summary
     
-    try:
-        print("🧠 正在生成AI财经摘要...")
-        ai_summary = summarize(analysis_text)
-        print(f"✅ AI摘要生成完成，长度: {len(ai_summary)}字符")
-        final_summary = f"📅 **{today_str} 财经新闻每日速递**\n\n✍️ **今日分析总结：**\n{ai_summary}\n\n---\n\n"
-    except Exception as e:
-        print(f"❌ AI摘要生成失败: {str(e)}")
-        final_summary = f"📅 **{today_str} 财经新闻每日速递**\n\n✍️ **今日分析总结：**\nAI摘要生成失败，请查看系统日志获取详细信息\n\n---\n\n"
-
-      # 新增: 生成板块和股票分析报告
-    try:
-        print("🔄 正在生成板块和股票分析报告...")
-        stock_report = sector_stock_analysis.generate_stock_report()
-        if stock_report:
-            final_summary += f"## 📊 板块与股票分析\n\n{stock_report}\n\n---\n\n"
-    except Exception as e:
-        print(f"❌ 板块和股票分析生成失败: {str(e)}")
-
-    print("📝 正在组装最终消息...")
-    for category, content in articles_data.items():
-        if content.strip():
-            print(f"   添加{category}类文章，长度: {len(content)}")
-            final_summary += f"## {category}\n{content}\n\n"
+    # 新增: 生成板块和股票分析报告（不依赖新闻，与RSS获取同时进行）
+    def stock_stage(inputs):
+        try:
+            import sector_stock_analysis
+            print("🔄 正在生成板块和股票分析报告...")
+            renderer = renderers['stock']
+            renderer.feed("## 📊 板块与股票分析\n\n")
+            stock_report = sector_stock_analysis.generate_stock_report(renderer.feed if LLM_STREAM else None)
+            cache_stats['fundamentals'] = sector_stock_analysis.fundamentals_cache.stats()
+            if stock_report:
+                stock_section = f"## 📊 板块与股票分析\n\n{stock_report}\n\n---\n\n"
+                if stock_section.startswith(renderer.source):
+                    renderer.feed(stock_section[len(renderer.source):])
+                return stock_section
+        except Exception as e:
+            print(f"❌ 板块和股票分析生成失败: {str(e)}")
+        return ""
     
     # 3. 获取access_token
-    access_token = get_access_token()
-    if not access_token:
-        print("❌ 获取access_token失败")
-        return
+    def token_stage(inputs):
+        try:
+            return get_access_token()
+        except Exception as e:
+            print(f"❌ 获取access_token出错: {str(e)}")
+            return None
+    
+    def compose_stage(inputs):
+        articles_data, _, _ = inputs['articles']
+        final_summary = inputs['summary'] + inputs['stock']
+        # 生成失败或未流式输出时，转换器中的内容与最终文本不一致，改为整体重新转换
+        for name in ('summary', 'stock'):
+            if renderers[name].source != inputs[name]:
+                renderers[name] = IncrementalMarkdownRenderer(MARKDOWN_LISTS)
+                renderers[name].feed(inputs[name])
+        # 新闻列表位于最后一部分的末尾
+        tail_renderer = renderers['stock'] if inputs['stock'] else renderers['summary']
+        print("📝 正在组装最终消息...")
+        for category, content in articles_data.items():
+            if content.strip():
+                print(f"   添加{category}类文章，长度: {len(content)}")
+                section = f"## {category}\n{content}\n\n"
+                final_summary += section
+                tail_renderer.feed(section)
+        return final_summary
     
     # 4. 生成HTML文件，使用完整内容
-    summary_html_path = generate_summary_html(final_summary)  # 使用完整内容
+    def html_stage(inputs):
+        final_summary = inputs['compose']
+        # 与 generate_summary_html 的分割位置一致时直接使用增量转换结果，否则整体转换
+        expected_split = len(inputs['summary']) if inputs['stock'] else -1
+        if final_summary.find("## 📊 板块与股票分析") == expected_split:
+            return generate_summary_html(final_summary, renderers['summary'].finish(), renderers['stock'].finish())
+        return generate_summary_html(final_summary)  # 使用完整内容
     
-    # 5. 发送消息到微信
-    response = send_news_to_wechat(access_token, final_summary, summary_html_path)
+    # 5. 发送消息到微信（OPEN_ID 以及 OPEN_IDS / OPEN_IDS_FILE 中的所有订阅用户）
+    def send_stage(inputs):
+        access_token = inputs['token']
+        if not access_token:
+            print("❌ 获取access_token失败")
+            return None
+        
+        recipients = wechat_client.load_recipients(openId)
+        result = broadcast_news_to_wechat(inputs['compose'], inputs['html'], recipients)
+        
+        if result['total'] and not result['failed']:
+            print(f"✅ {time_period}财经新闻推送成功，共{result['total']}人")
+        else:
+            print(f"❌ {time_period}财经新闻推送失败{result['failed']}/{result['total']}人: {result['failures']}")
+        print(f"   推送用时: {result['elapsed']:.2f}秒, 吞吐: {result['throughput']}条/秒")
+        # 至少推送成功一人时才把本次的条目记为已推送，失败的运行下次会重新处理
+        if result['success']:
+            seen_index.mark_seen(inputs['articles'][2])
+        return result
     
-    if response.get("errcode") == 0:
-        print(f"✅ {time_period}财经新闻推送成功")
-    else:
-        print(f"❌ {time_period}财经新闻推送失败: {response}")
+    results, timings = stage_runner.run_stages([
+        stage_runner.Stage("articles", fetch_articles_stage),
+        stage_runner.Stage("summary", summary_stage, ["articles"]),
+        stage_runner.Stage("stock", stock_stage),
+        stage_runner.Stage("token", token_stage),
+        stage_runner.Stage("compose", compose_stage, ["articles", "summary", "stock"]),
+        stage_runner.Stage("html", html_stage, ["compose", "summary", "stock"]),
+        stage_runner.Stage("send", send_stage, ["articles", "compose", "html", "token"]),
+    ], max_workers=max_workers, wrap=stage_wrapper)
+    total = max(timing['start'] + timing['duration'] for timing in timings.values())
+    print(f"⏱️ 总耗时 {total:.1f}秒，各阶段: " + ", ".join(
+        f"{name} {timing['duration']:.1f}秒" for name, timing in timings.items()))
+    cache_stats['llm_responses'] = llm_utils.response_cache.stats()
+    try:
+        metrics = run_metrics.write_json(extra={
+            'time_period': time_period,
+            'total': round(total, 3),
+            'stages': {name: {key: round(value, 3) for key, value in timing.items()} for name, timing in timings.items()},
+            'caches': cache_stats,
+            'feed_health': source_health.summary([url for _, _, url in feed_jobs(rss_feeds)]),
+        })
+        print(f"📈 运行指标已写入 {run_metrics.METRICS_FILE}")
+        print(run_metrics.format_summary(metrics))
+    except OSError as e:
+        print(f"❌ 写入运行指标失败: {str(e)}")
+    return results, timings
 
 if __name__ == '__main__':
-    news_report()
+    parser = argparse.ArgumentParser(description="生成并推送财经新闻")
+    parser.add_argument('--profile', action='store_true', help="性能分析模式：输出火焰图数据和各阶段内存分配报告")
+    parser.add_argument('--profile-dir', default="profile_output", help="性能分析报告的输出目录")
+    parser.add_argument('--profile-interval', type=float, default=5, help="调用栈采样间隔（毫秒）")
+    parser.add_argument('--profile-top', type=int, default=15, help="报告中列出的函数和代码行数量")
+    args = parser.parse_args()
+    if args.profile:
+        import profiler
+        profiler.run_profiled(news_report, args.profile_dir, args.profile_interval / 1000, args.profile_top)
+    else:
+        news_report()
 
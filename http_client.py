@@ -0,0 +1,43 @@
+# http_client.py - 共享的HTTP连接池（RSS、文章正文和微信接口共用，复用TCP/TLS连接）
+import os
+import threading
+
+# 统一使用浏览器User-Agent，部分RSS源会拒绝默认的脚本UA
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# 连接超时与读取超时（秒）
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "20"))
+# 缓存连接池的主机数量，以及每个主机保持的最大连接数（应不小于抓取并发数）
+POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "64"))
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "16"))
+
+_session = None
+_session_lock = threading.Lock()
+
+# 获取共享的requests会话，首次使用时才导入requests并创建
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            # 重试由调用方控制，这里不做自动重试
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({
+                'User-Agent': USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive',
+            })
+            _session = session
+        return _session
+
+def get(url, headers=None, timeout=None, **kwargs):
+    return get_session().get(url, headers=headers, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+
+def post(url, data=None, headers=None, timeout=None, **kwargs):
+    return get_session().post(url, data=data, headers=headers, timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
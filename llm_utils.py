@@ -0,0 +1,183 @@
+# llm_utils.py - 大模型调用辅助功能：共享客户端、token估算、按预算切分文本、用量统计、回复缓存
+import os
+import re
+import threading
+from types import SimpleNamespace
+import local_cache
+import run_metrics
+
+# 中日韩字符及全角标点约1个token，其余字符约4个字符1个token（粗略估算，无需额外依赖）
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+_usage_lock = threading.Lock()
+_client_lock = threading.Lock()
+_client = None
+
+# 大模型回复缓存（相同模型、提示词和输入直接返回缓存结果）
+# LLM_CACHE_BYPASS=1 时跳过读取缓存，强制重新生成（新结果仍会写入缓存）
+LLM_CACHE_BYPASS = os.environ.get("LLM_CACHE_BYPASS", "0") == "1"
+response_cache = local_cache.LLMResponseCache(
+    ttl=int(os.environ.get("LLM_CACHE_TTL", str(24 * 3600))),
+    max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", str(20 * 1024 * 1024))),
+)
+
+# 读取AI服务配置，返回 (api_key, api_base_url, model_name)
+def get_ai_config():
+    # 选择使用的AI服务 (deepseek 或 alimind)
+    ai_service = os.environ.get("AI_SERVICE", "deepseek")
+
+    if ai_service == "deepseek":
+        # DeepSeek API Key
+        api_key = os.environ.get("DEEPSEEK_API_KEY")
+        if not api_key:
+            raise ValueError("环境变量 DEEPSEEK_API_KEY 未设置!")
+        api_base_url = "https://api.deepseek.com/v1"
+        model_name = "deepseek-chat"
+    elif ai_service == "alimind":
+        # 阿里千文API配置
+        api_key = os.environ.get("ALI_MIND_API_KEY")
+        if not api_key:
+            raise ValueError("环境变量 ALI_MIND_API_KEY 未设置!")
+        api_base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # 阿里千文兼容OpenAI接口的地址
+        model_name = "qwen-turbo"  # 阿里千文模型名称
+    else:
+        raise ValueError(f"不支持的AI服务类型: {ai_service}")
+    # LLM_API_BASE 可指向其他兼容OpenAI接口的地址（如本地基准测试服务）
+    api_base_url = os.environ.get("LLM_API_BASE") or api_base_url
+    return api_key, api_base_url, model_name
+
+# 当前使用的模型名称
+def get_model_name():
+    return get_ai_config()[2]
+
+# 获取共享的OpenAI客户端，首次使用时才导入openai并创建
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from openai import OpenAI
+            api_key, api_base_url, model_name = get_ai_config()
+            _client = OpenAI(api_key=api_key, base_url=api_base_url)
+            print(f"使用AI服务: {os.environ.get('AI_SERVICE', 'deepseek')}, 模型: {model_name}")
+        return _client
+
+# 估算文本的token数
+def estimate_tokens(text):
+    if not text:
+        return 0
+    cjk_chars = len(_CJK_RE.findall(text))
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
+
+# 把拼接好的新闻正文拆回单篇文章块（每块以“【标题】”开头）
+def split_article_blocks(text):
+    blocks = text.split("\n\n【")
+    return [block if i == 0 else "【" + block for i, block in enumerate(blocks)]
+
+# 总量超过预算时按比例截断每篇文章，保留所有文章的标题和开头部分
+def fit_to_budget(text, total_tokens):
+    used_tokens = estimate_tokens(text)
+    if used_tokens <= total_tokens:
+        return text
+    ratio = total_tokens / used_tokens
+    blocks = split_article_blocks(text)
+    return "\n\n".join(block[:max(1, int(len(block) * ratio))].rstrip() for block in blocks)
+
+# 按token预算把文章块依次装入多个分片，单篇超出预算的文章独占一个分片
+def split_by_token_budget(blocks, chunk_tokens):
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block in blocks:
+        block_tokens = estimate_tokens(block)
+        if current and current_tokens + block_tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(block)
+        current_tokens += block_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+# 累计一次调用的token用量到 usage[stage]（usage为None时只计入运行指标）；completion为None表示命中缓存
+def record_usage(usage, stage, completion):
+    completion_usage = getattr(completion, 'usage', None)
+    run_metrics.incr('llm.calls')
+    if completion is None:
+        run_metrics.incr('llm.cache_hits')
+    elif completion_usage is not None:
+        run_metrics.incr('llm.prompt_tokens', completion_usage.prompt_tokens or 0)
+        run_metrics.incr('llm.completion_tokens', completion_usage.completion_tokens or 0)
+    if usage is None:
+        return
+    with _usage_lock:
+        stage_usage = usage.setdefault(stage, {'calls': 0, 'cached_calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0})
+        stage_usage['calls'] += 1
+        if completion is None:
+            stage_usage['cached_calls'] += 1
+        elif completion_usage is not None:
+            stage_usage['prompt_tokens'] += completion_usage.prompt_tokens or 0
+            stage_usage['completion_tokens'] += completion_usage.completion_tokens or 0
+
+# 调用聊天补全接口，优先返回缓存的回复；refresh=True 时强制重新生成
+# client 和 model 为None时使用共享客户端和当前配置的模型
+# 传入 on_text 时以流式方式调用，每收到一段文本就回调一次（拼接结果与返回值相同）；命中缓存时一次性回调
+def chat_completion(client, model, system_prompt, user_content, usage=None, stage="single", refresh=False, on_text=None):
+    model = model or get_model_name()
+    if not (refresh or LLM_CACHE_BYPASS):
+        cached = response_cache.get_response(model, system_prompt, user_content)
+        if cached is not None:
+            record_usage(usage, stage, None)
+            if on_text is not None and cached:
+                on_text(cached)
+            return cached
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    with run_metrics.span('llm.request'):
+        if on_text is None:
+            completion = (client or get_client()).chat.completions.create(model=model, messages=messages)
+            record_usage(usage, stage, completion)
+            content = completion.choices[0].message.content.strip()
+        else:
+            content = _stream_completion(client or get_client(), model, messages, usage, stage, on_text)
+    if content:
+        response_cache.set_response(model, system_prompt, user_content, content)
+    return content
+
+# 流式调用：去掉开头的空白，结尾的空白暂缓输出，使回调的文本与 strip() 后的完整回复一致
+def _stream_completion(client, model, messages, usage, stage, on_text):
+    stream = client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    parts = []
+    held = ""
+    started = False
+    completion_usage = None
+    for chunk in stream:
+        if getattr(chunk, 'usage', None) is not None:
+            completion_usage = chunk.usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if not started:
+            delta = delta.lstrip()
+            if not delta:
+                continue
+            started = True
+        text = held + delta
+        stripped = text.rstrip()
+        held = text[len(stripped):]
+        if stripped:
+            parts.append(stripped)
+            on_text(stripped)
+    # 最后一个分片带有整次调用的token用量
+    record_usage(usage, stage, SimpleNamespace(usage=completion_usage))
+    return "".join(parts)
@@ -0,0 +1,403 @@
+# local_cache.py - 本地持久化缓存（RSS条件请求缓存、文章正文缓存、股票基本面缓存、大模型回复缓存、已推送条目索引等）
+import os
+import json
+import time
+import sqlite3
+import struct
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# 缓存目录，GitHub Actions中通过actions/cache在多次运行之间恢复
+CACHE_DIR = os.environ.get("NEWS_CACHE_DIR", ".cache")
+
+# 规范化URL时去除的跟踪参数
+TRACKING_PARAMS = {
+    'spm', 'from', 'fromsource', 'share', 'share_token', 'ref', 'ref_src',
+    'fbclid', 'gclid', 'mc_cid', 'mc_eid', 'cmpid', 'mod', 'rss', 'feedtype',
+}
+TRACKING_PREFIXES = ('utm_',)
+
+# 规范化URL：统一大小写、去掉默认端口、片段和跟踪参数，并对查询参数排序
+def canonicalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    )
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+# 以URL的哈希作为缓存文件名
+def url_key(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+# 原子写入JSON文件，避免并发写入或中途退出留下损坏的缓存
+def write_json_atomic(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# 读取JSON文件，文件不存在或已损坏时返回None
+def read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# RSS源缓存：保存每个URL的ETag/Last-Modified以及解析后的条目
+class FeedCache:
+    # 只保存后续流程会用到的条目字段
+    ENTRY_FIELDS = ('title', 'link', 'guid', 'id', 'published')
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = os.path.join(cache_dir or CACHE_DIR, "feeds")
+
+    def _path(self, url):
+        return os.path.join(self.cache_dir, f"{url_key(url)}.json")
+
+    def load(self, url):
+        cached = read_json(self._path(url))
+        if not cached or cached.get('url') != url:
+            return None
+        return cached
+
+    def save(self, url, etag, modified, entries):
+        # 没有校验信息的源无法发起条件请求，不做缓存
+        if not etag and not modified:
+            return
+        write_json_atomic(self._path(url), {
+            'url': url,
+            'etag': etag,
+            'modified': modified,
+            'fetched_at': time.time(),
+            'entries': [
+                {field: entry.get(field) for field in self.ENTRY_FIELDS if entry.get(field)}
+                for entry in entries
+            ],
+        })
+
+# 基于SQLite的键值缓存，支持过期时间、按最近访问时间淘汰（LRU）以及命中统计
+# 超过条目数上限 max_entries 或总大小上限 max_bytes（为None时不限制）时淘汰最久未访问的条目
+class SqliteCache:
+    def __init__(self, name, ttl, max_entries, cache_dir=None, max_bytes=None):
+        self.path = os.path.join(cache_dir or CACHE_DIR, f"{name}.sqlite3")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON cache (accessed_at)")
+        return self._conn
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                    conn.commit()
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+            except sqlite3.Error:
+                # 缓存不可用时按未命中处理，不影响主流程
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._connect()
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                overflow = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+                if overflow > 0:
+                    # 淘汰最久未访问的条目
+                    conn.execute(
+                        "DELETE FROM cache WHERE key IN "
+                        "(SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                        (overflow,),
+                    )
+                if self.max_bytes is not None:
+                    self._evict_bytes(conn, key)
+                conn.commit()
+            except sqlite3.Error:
+                pass
+
+    # 总大小超过上限时按最近访问时间从旧到新淘汰，刚写入的条目保留
+    def _evict_bytes(self, conn, keep_key):
+        excess = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in conn.execute(
+                "SELECT key, LENGTH(value) FROM cache WHERE key != ? ORDER BY accessed_at ASC", (keep_key,)):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# 文章正文缓存，以规范化后的URL为键
+class ArticleCache(SqliteCache):
+    def __init__(self, ttl=3 * 24 * 3600, max_entries=2000, cache_dir=None):
+        super().__init__("articles", ttl, max_entries, cache_dir)
+
+    def get_text(self, url):
+        return self.get(canonicalize_url(url))
+
+    def set_text(self, url, text):
+        self.set(canonicalize_url(url), text)
+
+# 股票基本面（ticker.info）缓存：按字段设置有效期，过期不久的数据先返回旧值并在后台刷新
+class FundamentalsCache:
+    HOUR = 3600
+    # 各字段的有效期（秒），未列出的字段使用 default_ttl
+    FIELD_TTLS = {
+        'longName': 30 * 24 * HOUR,
+        'currency': 30 * 24 * HOUR,
+        'exchange': 30 * 24 * HOUR,
+        'profitMargins': 7 * 24 * HOUR,
+        'forwardPE': 24 * HOUR,
+        'trailingPE': 24 * HOUR,
+        # 下午推送（北京时间15:30）到次日早上推送（7:30）之间有一个完整的美股交易日，
+        # 股价的有效期必须短于两次推送的最短间隔（8小时）；只在读取时传入了股价字段才会生效，
+        # 选股流程的股价取自实时行情，不传入这两个字段，以免缩短其余基本面数据的有效期
+        'currentPrice': 6 * HOUR,
+        'regularMarketPrice': 6 * HOUR,
+    }
+    # 过期后不能先返回旧值的字段（过期倍数为1），其余字段使用 stale_factor
+    FIELD_STALE_FACTORS = {
+        'currentPrice': 1.0,
+        'regularMarketPrice': 1.0,
+    }
+
+    def __init__(self, field_ttls=None, default_ttl=24 * HOUR, stale_factor=2.0, cache_dir=None):
+        self.cache_dir = os.path.join(cache_dir or CACHE_DIR, "fundamentals")
+        self.field_ttls = dict(self.FIELD_TTLS, **(field_ttls or {}))
+        self.default_ttl = default_ttl
+        self.stale_factor = stale_factor
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._memory = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _path(self, symbol):
+        return os.path.join(self.cache_dir, f"{url_key(symbol)}.json")
+
+    def _load(self, symbol):
+        with self._lock:
+            if symbol in self._memory:
+                return self._memory[symbol]
+        entry = read_json(self._path(symbol))
+        if not entry or entry.get('symbol') != symbol:
+            return None
+        with self._lock:
+            self._memory[symbol] = entry
+        return entry
+
+    def _store(self, symbol, info):
+        # 只保存可JSON序列化的标量字段
+        entry = {
+            'symbol': symbol,
+            'fetched_at': time.time(),
+            'info': {key: value for key, value in info.items()
+                     if isinstance(value, (str, int, float, bool)) or value is None},
+        }
+        with self._lock:
+            self._memory[symbol] = entry
+        try:
+            write_json_atomic(self._path(symbol), entry)
+        except OSError:
+            pass
+        return entry
+
+    def _refresh(self, symbol, loader):
+        try:
+            self._store(symbol, loader())
+        except Exception:
+            # 后台刷新失败时保留旧数据，下次读取时再尝试
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(symbol)
+
+    def _refresh_in_background(self, symbol, loader):
+        with self._lock:
+            if symbol in self._refreshing:
+                return
+            self._refreshing.add(symbol)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2)
+            self._executor.submit(self._refresh, symbol, loader)
+
+    # 读取基本面数据：fields为本次用到的字段，决定数据是否仍然新鲜；loader在需要时从网络获取完整info
+    def get(self, symbol, loader, fields=()):
+        ttl = min([self.field_ttls.get(field, self.default_ttl) for field in fields] or [self.default_ttl])
+        stale_ttl = min([self.field_ttls.get(field, self.default_ttl) * self.FIELD_STALE_FACTORS.get(field, self.stale_factor)
+                         for field in fields] or [self.default_ttl * self.stale_factor])
+        entry = self._load(symbol)
+        if entry is not None:
+            age = time.time() - entry['fetched_at']
+            if age <= ttl:
+                self.hits += 1
+                return entry['info']
+            if age <= stale_ttl:
+                self.stale_hits += 1
+                self._refresh_in_background(symbol, loader)
+                return entry['info']
+
+        self.misses += 1
+        return self._store(symbol, loader())['info']
+
+    def stats(self):
+        return {'hits': self.hits, 'stale_hits': self.stale_hits, 'misses': self.misses}
+
+# 大模型回复缓存，以模型名、系统提示词和用户内容的哈希为键
+class LLMResponseCache(SqliteCache):
+    def __init__(self, ttl=24 * 3600, max_entries=500, max_bytes=20 * 1024 * 1024, cache_dir=None):
+        super().__init__("llm_responses", ttl, max_entries, cache_dir, max_bytes=max_bytes)
+
+    @staticmethod
+    def make_key(model, system_prompt, user_content):
+        payload = json.dumps([model, system_prompt, user_content], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_response(self, model, system_prompt, user_content):
+        return self.get(self.make_key(model, system_prompt, user_content))
+
+    def set_response(self, model, system_prompt, user_content, response):
+        self.set(self.make_key(model, system_prompt, user_content), response)
+
+# 已推送条目索引：以guid或规范化链接的64位哈希为键，记录最后一次推送的时间
+# 文件为追加写入的定长记录（8字节哈希 + 4字节时间戳），
+# 失效记录（超过保留期限或被新记录覆盖）占比过高时重写文件进行压缩
+class SeenIndex:
+    RECORD = struct.Struct('<QI')
+
+    def __init__(self, retention=14 * 24 * 3600, max_entries=50000, cache_dir=None):
+        self.path = os.path.join(cache_dir or CACHE_DIR, "seen_entries.bin")
+        self.retention = retention
+        self.max_entries = max_entries
+        self._seen = None
+        self._file_records = 0
+        self._lock = threading.Lock()
+
+    # 条目的唯一标识：优先使用guid，没有时使用规范化后的链接
+    @staticmethod
+    def entry_key(entry):
+        guid = entry.get('id') or entry.get('guid')
+        if guid:
+            return f"guid:{guid.strip()}"
+        link = entry.get('link')
+        return f"link:{canonicalize_url(link)}" if link else None
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def _load(self):
+        if self._seen is not None:
+            return
+        self._seen = {}
+        self._file_records = 0
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        # 忽略中途退出时写了一半的记录
+        usable = len(data) - len(data) % self.RECORD.size
+        # 字典顺序即推送先后顺序，后出现的记录覆盖之前的记录
+        for digest, seen_at in self.RECORD.iter_unpack(data[:usable]):
+            self._seen.pop(digest, None)
+            self._seen[digest] = seen_at
+        self._file_records = usable // self.RECORD.size
+
+    def contains(self, key):
+        with self._lock:
+            self._load()
+            seen_at = self._seen.get(self._hash(key))
+            return seen_at is not None and seen_at >= time.time() - self.retention
+
+    # 记录已推送的条目（追加写入），必要时压缩文件
+    def mark_seen(self, keys):
+        now = int(time.time())
+        digests = list(dict.fromkeys(self._hash(key) for key in keys if key))
+        if not digests:
+            return
+        with self._lock:
+            self._load()
+            for digest in digests:
+                self._seen.pop(digest, None)
+                self._seen[digest] = now
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.write(b"".join(self.RECORD.pack(digest, now) for digest in digests))
+            self._file_records += len(digests)
+            if self._file_records > 2 * len(self._seen) or len(self._seen) > self.max_entries:
+                self._compact()
+
+    # 去掉过期记录，超过上限时保留最近推送的条目，然后原子重写文件
+    def _compact(self):
+        cutoff = time.time() - self.retention
+        live = [(digest, seen_at) for digest, seen_at in self._seen.items() if seen_at >= cutoff]
+        live = live[-self.max_entries:] if self.max_entries else []
+        self._seen = dict(live)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(b"".join(self.RECORD.pack(digest, seen_at) for digest, seen_at in live))
+        os.replace(tmp_path, self.path)
+        self._file_records = len(live)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._seen)
@@ -0,0 +1,95 @@
+# markdown_render.py - 摘要Markdown转HTML（标题、粗体、链接、换行、列表），支持流式增量转换
+import re
+
+# 标题行的开头（换行符后紧跟1~4个#和空格），两个标题行之间的内容转换结果互不影响
+_SECTION_START_RE = re.compile(r'\n(?=#{1,4} )')
+
+# 一次扫描找出标题相关的所有位置：
+# 1) 换行符后紧跟1~4个#和空格的标题行（第一行前面没有换行符，保持原样）
+# 2) 换行符后紧跟<h的行（标题的结束位置）  3) 文本中的<h1>~<h4>开始标签
+_HEADING_SCAN_RE = re.compile(r'\n(#{1,4}) |\n(?=<h)|<h([1-4])>')
+_HEADING_OPEN = {'#' * level: '\n<h%d>' % level for level in range(1, 5)}
+_HEADING_CLOSE = ('</h1>', '</h2>', '</h3>', '</h4>')
+
+# 转换标题：标题的结束标签放在下一个以<h开头的行之前（或全文末尾），因此一个标题会包含其后的正文；
+# 同一位置有多个结束标签时按 h4→h1 的顺序排列，与页面样式依赖的原有输出保持一致
+def _convert_headings(content):
+    pieces = []
+    opened = [False] * 4
+    pos = 0
+    for match in _HEADING_SCAN_RE.finditer(content):
+        hashes, tag_level = match.group(1, 2)
+        if tag_level:
+            opened[int(tag_level) - 1] = True
+            continue
+        pieces.append(content[pos:match.start()])
+        pos = match.end()
+        if any(opened):
+            pieces.extend(_HEADING_CLOSE[level] for level in range(3, -1, -1) if opened[level])
+            opened = [False] * 4
+        if hashes:
+            pieces.append(_HEADING_OPEN[hashes])
+            opened[len(hashes) - 1] = True
+        else:
+            pieces.append('\n')
+    pieces.append(content[pos:])
+    pieces.extend(_HEADING_CLOSE[level] for level in range(3, -1, -1) if opened[level])
+    return ''.join(pieces)
+
+# 粗体与链接（链接地址允许两层括号嵌套；地址部分只有一种匹配方式，用占有量词避免匹配失败时回溯）
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_LINK_RE = re.compile(r'\[(.*?)\]\(((?:[^()]++|\((?:[^()]++|\([^()]*+\))*+\))*+)\)')
+# 连续的列表项：“- ”或“* ”开头为无序列表，“1. ”开头为有序列表；行尾的标题结束标签移到列表之后
+_LIST_BLOCK_RE = re.compile(r'^(?:[-*] .*(?:\n[-*] .*)*|\d+\. .*(?:\n\d+\. .*)*)', re.M)
+_LIST_ITEM_RE = re.compile(r'(?:[-*]|\d+\.) (.*?)((?:</h[1-4]>)*)$')
+
+def _convert_list_block(match):
+    tag = 'ol' if match.group(0)[0].isdigit() else 'ul'
+    items = [_LIST_ITEM_RE.match(line).groups() for line in match.group(0).split('\n')]
+    return '<%s>%s</%s>%s' % (tag, ''.join('<li>%s</li>' % text for text, _ in items), tag, items[-1][1])
+
+# Markdown转HTML：标题、粗体、链接和换行各由一个预编译的表达式处理一遍
+# lists=True 时把连续的列表项转换为<ul>/<ol>（默认关闭，输出与原有格式相同）
+def convert_markdown_to_html(content, lists=False):
+    formatted = _convert_headings(content)
+    if '**' in formatted:
+        formatted = _BOLD_RE.sub(r'<strong>\1</strong>', formatted)
+    if lists:
+        formatted = _LIST_BLOCK_RE.sub(_convert_list_block, formatted)
+    if '](' in formatted:
+        formatted = _LINK_RE.sub(r'<a href="\2">\1</a>', formatted)
+    return formatted.replace('\n', '<br>')
+
+# 增量转换器：边接收流式文本边转换已完整的段落（以标题行为界），
+# 结果与对完整文本调用 convert_markdown_to_html 相同
+class IncrementalMarkdownRenderer:
+    def __init__(self, lists=False):
+        self.lists = lists
+        self.source = ""
+        self._pending = ""
+        self._html_parts = []
+
+    # 追加文本，返回本次新完成段落的HTML（可能为空字符串）
+    def feed(self, text):
+        self.source += text
+        self._pending += text
+        # 最后一个标题行之前的内容已经完整，标题行及之后的内容可能还会继续增长
+        last_start = None
+        for match in _SECTION_START_RE.finditer(self._pending, 1):
+            last_start = match.start()
+        if last_start is None:
+            return ""
+        html = convert_markdown_to_html(self._pending[:last_start], self.lists)
+        # 还有未转换的“](”时，链接地址可能延续到后面的段落，等待更多内容再转换
+        if '](' in html:
+            return ""
+        self._pending = self._pending[last_start:]
+        self._html_parts.append(html)
+        return html
+
+    # 输入结束，转换剩余内容并返回完整HTML
+    def finish(self):
+        if self._pending:
+            self._html_parts.append(convert_markdown_to_html(self._pending, self.lists))
+            self._pending = ""
+        return "".join(self._html_parts)
@@ -0,0 +1,71 @@
+# news_dedup.py - 跨RSS源的文章去重（规范化URL精确匹配 + 标题SimHash近似匹配）
+import re
+import hashlib
+from local_cache import canonicalize_url
+
+# SimHash指纹位数与分段数：汉明距离不超过 SIMHASH_BANDS - 1 的两个指纹至少有一段完全相同
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# 标题归一化：转小写并去除标点和空白
+def normalize_title(title):
+    return re.sub(r'[\W_]+', '', (title or '').lower())
+
+# 计算标题的SimHash指纹（字符二元组作为特征，中英文标题通用）
+def title_simhash(title):
+    text = normalize_title(title)
+    features = [text[i:i + 2] for i in range(len(text) - 1)] or [text]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+# 文章去重索引：先按规范化URL精确匹配，再按标题指纹查找近似重复
+class ArticleDeduplicator:
+    def __init__(self, max_distance=SIMHASH_BANDS - 1, min_title_length=6):
+        self.max_distance = min(max_distance, SIMHASH_BANDS - 1)
+        self.min_title_length = min_title_length
+        self.duplicates = 0
+        self._by_url = {}
+        self._bands = [{} for _ in range(SIMHASH_BANDS)]
+
+    def _band_keys(self, fingerprint):
+        return [(fingerprint >> (band * BAND_BITS)) & BAND_MASK for band in range(SIMHASH_BANDS)]
+
+    def _fingerprint(self, title):
+        if len(normalize_title(title)) < self.min_title_length:
+            return None
+        return title_simhash(title)
+
+    # 查找重复文章，找到时返回已登记的对象，否则返回None
+    def find(self, link, title):
+        url = canonicalize_url(link)
+        if url in self._by_url:
+            self.duplicates += 1
+            return self._by_url[url]
+
+        fingerprint = self._fingerprint(title)
+        if fingerprint is not None:
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                for other_fingerprint, other_item in self._bands[band].get(key, ()):
+                    if bin(fingerprint ^ other_fingerprint).count('1') <= self.max_distance:
+                        self.duplicates += 1
+                        self._by_url[url] = other_item
+                        return other_item
+        return None
+
+    # 登记新文章
+    def add(self, link, title, item):
+        self._by_url[canonicalize_url(link)] = item
+        fingerprint = self._fingerprint(title)
+        if fingerprint is not None:
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                self._bands[band].setdefault(key, []).append((fingerprint, item))
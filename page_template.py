@@ -0,0 +1,322 @@
+# page_template.py - 新闻摘要页面模板：样式和脚本输出为带内容哈希的静态文件（可长期缓存），
+# 页面本身只包含每次变化的内容，同时生成预压缩的 .gz 文件
+import os
+import re
+import gzip
+import hashlib
+import threading
+
+# 静态文件目录（相对于页面所在目录）
+STATIC_DIR = "static"
+# 内容哈希的长度（十六进制字符数）
+ASSET_HASH_LENGTH = 10
+
+# 页面样式
+PAGE_CSS = '''\
+/* 安全区域样式重置 */
+* {
+    margin: 0;
+    padding: 0;
+    box-sizing: border-box;
+}
+
+/* 基础样式 */
+body {
+    font-family: -apple-system, BlinkMacSystemFont, 'PingFang SC', 'Microsoft YaHei', Arial, sans-serif;
+    line-height: 1.7;
+    color: #333;
+    max-width: 100%;
+    margin: 0;
+    padding: 0;
+    background-color: #f8f8f8;
+    -webkit-text-size-adjust: 100%;
+    -webkit-tap-highlight-color: transparent;
+}
+
+/* 容器样式 */
+.container {
+    max-width: 800px;
+    margin: 0 auto;
+    padding: 20px 15px;
+    background-color: #fff;
+    min-height: 100vh;
+}
+
+/* 标题样式 */
+h1, h2, h3, h4 {
+    color: #2c3e50;
+    margin: 15px 0 10px 0;
+    line-height: 1.4;
+}
+
+h1 {
+    font-size: 22px;
+    padding-bottom: 10px;
+    border-bottom: 1px solid #eee;
+}
+h2 {
+    font-size: 20px;
+}
+h3 {
+    font-size: 18px;
+}
+h4 {
+    font-size: 16px;
+    color: #555;
+}
+
+/* 粗体样式 */
+strong {
+    color: #e74c3c;
+    font-weight: 600;
+}
+
+/* 链接样式 */
+a {
+    color: #3498db;
+    text-decoration: none;
+    border-bottom: 1px solid #3498db;
+}
+
+a:hover {
+    text-decoration: underline;
+}
+
+/* 内容样式 */
+.summary-content {
+    background: white;
+    padding: 0;
+}
+.summary-meta {
+    color: #666;
+    font-size: 14px;
+    margin-bottom: 15px;
+    padding-bottom: 15px;
+    border-bottom: 1px solid #eee;
+}
+
+.summary-body {
+    font-size: 16px;
+    color: #333;
+}
+
+/* 段落样式 */
+.summary-body > div {
+    margin-bottom: 15px;
+}
+
+/* Tab样式 */
+.tab-container {
+    margin-top: 20px;
+    border: 1px solid #e0e0e0;
+    border-radius: 8px;
+    overflow: hidden;
+    box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+}
+
+.tab-headers {
+    display: flex;
+    background-color: #f8f8f8;
+    border-bottom: 1px solid #e0e0e0;
+}
+
+.tab-header {
+    flex: 1;
+    padding: 15px 20px;
+    text-align: center;
+    cursor: pointer;
+    transition: all 0.3s ease;
+    font-weight: 600;
+    color: #666;
+    border-bottom: 3px solid transparent;
+}
+
+.tab-header:hover {
+    background-color: #f0f0f0;
+    color: #3498db;
+}
+
+.tab-header.active {
+    background-color: #fff;
+    color: #3498db;
+    border-bottom-color: #3498db;
+}
+
+.tab-content {
+    padding: 20px;
+    display: none;
+}
+
+.tab-content.active {
+    display: block;
+}
+
+/* 响应式设计 */
+@media (max-width: 480px) {
+    .container {
+        padding: 15px 12px;
+    }
+
+    h1 {
+        font-size: 20px;
+    }
+    h2 {
+        font-size: 18px;
+    }
+    h3 {
+        font-size: 16px;
+    }
+    h4 {
+        font-size: 15px;
+    }
+
+    .summary-body {
+        font-size: 15px;
+    }
+
+    .tab-header {
+        padding: 12px 10px;
+        font-size: 14px;
+    }
+
+    .tab-content {
+        padding: 15px 10px;
+    }
+}
+'''
+
+# 页面脚本：Tab切换与兼容性处理
+PAGE_JS = '''\
+// Tab切换功能
+function switchTab(tabId) {
+    // 隐藏所有内容，移除所有活动状态
+    const contents = document.querySelectorAll('.tab-content');
+    const headers = document.querySelectorAll('.tab-header');
+
+    contents.forEach(content => content.classList.remove('active'));
+    headers.forEach(header => header.classList.remove('active'));
+
+    // 显示选中内容，添加活动状态
+    document.getElementById(tabId).classList.add('active');
+    document.querySelector(`[onclick="switchTab('${tabId}')"]`).classList.add('active');
+
+    // 滚动到顶部
+    window.scrollTo({
+        top: 0,
+        behavior: 'smooth'
+    });
+}
+
+// 简单的兼容性脚本
+document.addEventListener('DOMContentLoaded', function() {
+    // 处理iOS Safari上的滚动问题
+    document.body.style.webkitOverflowScrolling = 'touch';
+
+    // 防止缓存
+    window.onpageshow = function(event) {
+        if (event.persisted) {
+            window.location.reload();
+        }
+    };
+});
+'''
+
+# 页面骨架：{{名称}} 为每次生成时替换的内容
+PAGE_TEMPLATE = '''\
+<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <meta name="format-detection" content="telephone=no">
+    <meta name="apple-mobile-web-app-capable" content="yes">
+    <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">
+    <meta http-equiv="Pragma" content="no-cache">
+    <meta http-equiv="Expires" content="0">
+    <title>财经新闻速递</title>
+    <link rel="stylesheet" href="{{css_href}}">
+    <script src="{{js_href}}" defer></script>
+</head>
+<body>
+    <div class="container">
+        <div class="summary-content">
+            <h1>财经新闻速递</h1>
+            <div class="summary-meta">生成时间: {{current_time}} (版本: {{timestamp}})</div>
+            <div class="tab-container">
+                <div class="tab-headers">
+                    <div class="tab-header active" onclick="switchTab('finance')">财经要点摘要</div>
+                    <div class="tab-header" onclick="switchTab('stocks')">板块与股票分析</div>
+                </div>
+                <div id="finance" class="tab-content active summary-body">
+                    {{finance_html}}
+                </div>
+                <div id="stocks" class="tab-content summary-body">
+                    {{stock_analysis_html}}
+                </div>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+'''
+
+_PLACEHOLDER_RE = re.compile(r'\{\{(\w+)\}\}')
+
+# 把模板预先拆分为固定文本和占位符名称，生成页面时只需按顺序拼接
+def compile_template(template):
+    parts = _PLACEHOLDER_RE.split(template)
+    return parts[0::2], parts[1::2]
+
+_compiled_page = compile_template(PAGE_TEMPLATE)
+
+def render_template(compiled, values):
+    texts, names = compiled
+    pieces = [texts[0]]
+    for name, text in zip(names, texts[1:]):
+        pieces.append(str(values[name]))
+        pieces.append(text)
+    return "".join(pieces)
+
+# 原子写入文件，并在旁边生成预压缩的 .gz 文件（mtime固定为0，内容不变时压缩结果也不变）
+def write_with_gzip(path, content):
+    data = content.encode('utf-8')
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    for target, payload in ((path, data), (path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))):
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, target)
+
+# 按内容哈希命名的静态文件名，如 summary.1a2b3c4d5e.css
+def asset_name(content, ext):
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:ASSET_HASH_LENGTH]
+    return f"summary.{digest}.{ext}"
+
+# 写出样式和脚本文件（已存在时跳过），并删除旧版本，返回 {扩展名: 相对页面的路径}
+def write_static_assets(page_dir="."):
+    static_dir = os.path.join(page_dir, STATIC_DIR)
+    hrefs = {}
+    current = set()
+    for ext, content in (("css", PAGE_CSS), ("js", PAGE_JS)):
+        name = asset_name(content, ext)
+        path = os.path.join(static_dir, name)
+        if not (os.path.exists(path) and os.path.exists(path + ".gz")):
+            write_with_gzip(path, content)
+        hrefs[ext] = f"{STATIC_DIR}/{name}"
+        current.update((name, name + ".gz"))
+
+    for name in os.listdir(static_dir):
+        if name.startswith("summary.") and name not in current:
+            os.remove(os.path.join(static_dir, name))
+    return hrefs
+
+# 生成页面HTML（样式和脚本通过静态文件引用）
+def render_page(finance_html, stock_analysis_html, current_time, timestamp, hrefs):
+    return render_template(_compiled_page, {
+        'css_href': hrefs['css'],
+        'js_href': hrefs['js'],
+        'current_time': current_time,
+        'timestamp': timestamp,
+        'finance_html': finance_html,
+        'stock_analysis_html': stock_analysis_html,
+    })
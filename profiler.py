@@ -0,0 +1,177 @@
+# profiler.py - 性能分析模式：采样调用栈生成火焰图数据（collapsed stack 格式），并按阶段统计内存分配
+# 用法: python finance_news_push.py --profile [--profile-dir profile_output] [--profile-interval 5] [--profile-top 15]
+# 分析模式下各阶段依次执行（不并发），使采样和内存分配都能准确归属到阶段
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import linecache
+
+# 线程池空闲线程停在 _worker 中等待任务，主线程在 run_stages 中等待阶段完成，这类采样不计入
+_IDLE_LEAF = "thread:_worker"
+_IDLE_CALLER = "stage_runner:run_stages"
+
+def _frame_label(frame):
+    code = frame.f_code
+    if code.co_filename.startswith('<'):
+        module = code.co_filename.strip('<>')
+    else:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+# 后台线程按固定间隔采样所有线程的调用栈，按 阶段;线程;栈帧... 聚合次数（墙钟时间，包含等待IO的时间）
+class SamplingProfiler:
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stage = "main"
+        self.samples = {}
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stage = self.stage
+            if stage is None:
+                continue
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack[0] == _IDLE_LEAF or _IDLE_CALLER in stack:
+                    continue
+                # 线程池线程名去掉末尾的序号，同一线程池的采样合并到一起
+                thread_name = names.get(ident, "thread").rsplit('_', 1)[0]
+                key = (stage, thread_name) + tuple(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            self.sample_count += 1
+
+    # collapsed stack 格式：每行 "帧1;帧2;...;帧N 次数"，可直接用 flamegraph.pl 或 speedscope 打开
+    def collapsed(self):
+        return "".join(f"{';'.join(stack)} {count}\n"
+                       for stack, count in sorted(self.samples.items(), key=lambda item: item[1], reverse=True))
+
+    # 按函数统计自身耗时（位于栈顶的采样数），返回前 top 项 [(函数, 采样数)]
+    def top_functions(self, top=15):
+        counts = {}
+        for stack, count in self.samples.items():
+            counts[stack[-1]] = counts.get(stack[-1], 0) + count
+        return sorted(counts.items(), key=lambda item: item[1], reverse=True)[:top]
+
+# 记录分配调用栈的帧数：需要足够深，才能识别出采样线程在标准库中（如 threading.enumerate）产生的分配
+TRACE_FRAMES = 8
+# 调用栈中任一帧经过分析器本身或 tracemalloc 的分配都不计入
+_EXCLUDED_FILES = {tracemalloc.__file__, __file__}
+
+# 按完整调用栈对比两次快照，去掉经过 _EXCLUDED_FILES 的调用栈后按最内层代码行汇总
+# 返回按新增大小降序的 [(文件, 行号, 新增字节数, 新增块数)]
+# （snapshot.filter_traces 对每条记录的每一帧做通配符匹配，在大快照上慢得无法使用）
+def _allocation_diff(before, after):
+    totals = {}
+    for stat in after.compare_to(before, 'traceback'):
+        if any(frame.filename in _EXCLUDED_FILES for frame in stat.traceback):
+            continue
+        # Traceback 中的帧从外到内排列，最后一帧才是实际分配内存的代码行
+        frame = stat.traceback[-1]
+        size, count = totals.get((frame.filename, frame.lineno), (0, 0))
+        totals[(frame.filename, frame.lineno)] = (size + stat.size_diff, count + stat.count_diff)
+    return sorted(((filename, lineno, size, count) for (filename, lineno), (size, count) in totals.items()),
+                  key=lambda item: item[2], reverse=True)
+
+# 一次性能分析：采样调用栈，并在每个阶段前后各做一次内存快照，对比得到该阶段新增的内存分配
+class StageProfiler:
+    def __init__(self, interval=0.005, top=15):
+        self.sampler = SamplingProfiler(interval)
+        self.top = top
+        self.allocations = {}
+        self.stage_peaks = {}
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+        tracemalloc.stop()
+
+    # 作为 stage_runner.run_stages 的 wrap 参数，包装每个阶段的执行函数
+    def wrap_stage(self, name, func):
+        # 快照和对比的耗时较长，期间暂停采样（stage 为None）
+        def profiled(inputs):
+            self.sampler.stage = None
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            self.sampler.stage = name
+            try:
+                return func(inputs)
+            finally:
+                self.sampler.stage = None
+                self.stage_peaks[name] = tracemalloc.get_traced_memory()[1]
+                self.allocations[name] = _allocation_diff(before, tracemalloc.take_snapshot())[:self.top]
+                self.sampler.stage = "main"
+        return profiled
+
+    def allocation_report(self):
+        lines = []
+        for stage, stats in self.allocations.items():
+            lines.append(f"== {stage}: 峰值 {self.stage_peaks[stage] / 1024 / 1024:.1f}MB，新增分配前{len(stats)}项 ==")
+            for filename, lineno, size_diff, count_diff in stats:
+                source = linecache.getline(filename, lineno).strip()
+                lines.append(f"{size_diff / 1024:>10.1f}KB {count_diff:>8}块  {filename}:{lineno}  {source}")
+            lines.append("")
+        return "\n".join(lines)
+
+    # 写入 stacks.collapsed（火焰图数据）和 allocations.txt（各阶段内存分配），返回两个文件路径
+    def write_reports(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        stacks_path = os.path.join(output_dir, "stacks.collapsed")
+        allocations_path = os.path.join(output_dir, "allocations.txt")
+        with open(stacks_path, 'w', encoding='utf-8') as f:
+            f.write(self.sampler.collapsed())
+        with open(allocations_path, 'w', encoding='utf-8') as f:
+            f.write(self.allocation_report())
+        return stacks_path, allocations_path
+
+    def summary(self):
+        total = sum(self.sampler.samples.values()) or 1
+        lines = [f"采样 {self.sampler.sample_count} 次（间隔 {self.sampler.interval * 1000:.0f}ms），自身耗时最多的函数:"]
+        for function, count in self.sampler.top_functions(self.top):
+            lines.append(f"{count / total * 100:>6.1f}%  {function}")
+        lines.append("各阶段新增内存最多的代码行:")
+        for stage, stats in self.allocations.items():
+            if stats:
+                filename, lineno, size_diff, _ = stats[0]
+                lines.append(f"   {stage}: {size_diff / 1024:.1f}KB  {os.path.basename(filename)}:{lineno}")
+        return "\n".join(lines)
+
+# 在性能分析模式下执行 run(stage_wrapper, max_workers)，结束后写入报告并打印摘要
+def run_profiled(run, output_dir, interval=0.005, top=15):
+    profiler = StageProfiler(interval, top)
+    start = time.perf_counter()
+    profiler.start()
+    try:
+        return run(stage_wrapper=profiler.wrap_stage, max_workers=1)
+    finally:
+        profiler.stop()
+        stacks_path, allocations_path = profiler.write_reports(output_dir)
+        print(f"🔬 性能分析完成，用时 {time.perf_counter() - start:.1f}秒")
+        print(profiler.summary())
+        print(f"   火焰图数据: {stacks_path}（flamegraph.pl 或 speedscope 可直接打开）")
+        print(f"   内存分配报告: {allocations_path}")
@@ -0,0 +1,123 @@
+# retry_policy.py - 统一的重试与超时策略：整次运行的截止时间、单次尝试超时、指数退避加随机抖动、慢请求对冲
+# RSS、文章正文、行情数据和微信接口共用，使单个失效的站点不会拖慢整次运行
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import run_metrics
+
+# 整次运行的截止时间（秒，从启动时算起），超过后不再发起新的请求或重试
+RUN_DEADLINE = float(os.environ.get("RUN_DEADLINE", "600"))
+# 对冲请求使用的线程数
+HEDGE_WORKERS = int(os.environ.get("RETRY_HEDGE_WORKERS", "8"))
+
+_run_start = time.monotonic()
+_hedge_pool = None
+_hedge_lock = threading.Lock()
+
+# 距离运行截止时间的剩余秒数
+def remaining():
+    return RUN_DEADLINE - (time.monotonic() - _run_start)
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+        return _hedge_pool
+
+# 超过运行截止时间时抛出
+class DeadlineExceeded(TimeoutError):
+    pass
+
+# HTTP状态码为4xx（429限流除外）时重试也不会成功
+def is_retryable_status(status):
+    return not (status is not None and 400 <= status < 500 and status != 429)
+
+# 运行超时和4xx错误不重试，其余异常（网络错误、超时、5xx等）可以重试
+def is_retryable(error):
+    if isinstance(error, DeadlineExceeded):
+        return False
+    return is_retryable_status(getattr(getattr(error, 'response', None), 'status_code', None))
+
+# 重试策略
+# attempts: 最多尝试次数；timeout: 单次尝试的超时（秒），不超过剩余的运行时间
+# backoff/max_backoff: 第n次重试前等待 min(max_backoff, backoff * 2**n) 秒，再按 jitter 比例随机缩短，避免同时重试
+# hedge_after: 单次尝试超过该秒数仍未返回时再并行发起一次相同请求，取先返回的结果；None表示不对冲
+# use_deadline: 是否受运行截止时间限制
+class RetryPolicy:
+    def __init__(self, name, attempts=3, timeout=20, backoff=1.0, max_backoff=10, jitter=0.5,
+                 hedge_after=None, use_deadline=True):
+        self.name = name
+        self.attempts = max(1, attempts)
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.hedge_after = hedge_after
+        self.use_deadline = use_deadline
+
+    def remaining(self):
+        return remaining() if self.use_deadline else float('inf')
+
+    # 本次尝试可用的超时，运行已超时时抛出 DeadlineExceeded
+    def attempt_timeout(self):
+        left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded("已超过运行截止时间")
+        return min(self.timeout, left)
+
+    # 第 attempt 次重试前的等待时间（attempt 从0开始）
+    def backoff_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * (1 - self.jitter * random.random())
+
+    # 等待退避时间后返回True；剩余运行时间不足以等待和再试一次时返回False
+    def sleep_before_retry(self, attempt):
+        delay = self.backoff_delay(attempt)
+        if delay >= self.remaining():
+            return False
+        run_metrics.incr(f'{self.name}.retries')
+        time.sleep(delay)
+        return True
+
+    # 执行 func(timeout)，失败时按策略重试
+    # retry_result(result) 为True时（如RSS没有条目）也会重试，重试次数用完后返回最后一次的结果
+    # 异常无法重试或次数用完时抛出最后一次的异常
+    def call(self, func, retry_result=None):
+        for attempt in range(self.attempts):
+            try:
+                result = self._attempt(func, self.attempt_timeout())
+                if retry_result is None or not retry_result(result):
+                    return result
+                error = None
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                result, error = None, e
+            if attempt == self.attempts - 1 or not self.sleep_before_retry(attempt):
+                break
+        if error is not None:
+            raise error
+        return result
+
+    def _attempt(self, func, timeout):
+        if self.hedge_after is None or self.hedge_after >= timeout:
+            return func(timeout)
+        pool = _get_hedge_pool()
+        futures = [pool.submit(func, timeout)]
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            # 首次请求较慢，再发起一次，剩余时间内先成功的结果生效
+            run_metrics.incr(f'{self.name}.hedged')
+            futures.append(pool.submit(func, max(0.1, timeout - self.hedge_after)))
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
@@ -0,0 +1,87 @@
+# run_metrics.py - 运行指标：各环节耗时（span）和计数器（字节数、重试次数、缓存命中、token用量等）
+# 每次运行结束后写入JSON文件并打印汇总表，用于对比不同运行之间的性能变化
+import os
+import time
+import threading
+from contextlib import contextmanager
+from functools import wraps
+import local_cache
+
+# 指标文件路径
+METRICS_FILE = os.environ.get("RUN_METRICS_FILE", "run_metrics.json")
+
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+
+# 记录一段代码的耗时（秒），同名span累计统计
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_duration(name, time.perf_counter() - start)
+
+# 装饰器：记录函数每次调用的耗时
+def timed(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_duration(name, seconds):
+    with _lock:
+        _spans.setdefault(name, []).append(seconds)
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+# 当前的指标快照：每个span的次数、总耗时、平均、P50、P95和最大耗时，以及全部计数器
+def snapshot():
+    with _lock:
+        spans = {name: sorted(values) for name, values in _spans.items()}
+        counters = dict(_counters)
+    return {
+        'spans': {
+            name: {
+                'count': len(values),
+                'total': round(sum(values), 4),
+                'mean': round(sum(values) / len(values), 4),
+                'p50': round(_percentile(values, 0.5), 4),
+                'p95': round(_percentile(values, 0.95), 4),
+                'max': round(values[-1], 4),
+            }
+            for name, values in sorted(spans.items())
+        },
+        'counters': dict(sorted(counters.items())),
+    }
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+# 把指标快照和附加信息（如各阶段耗时、缓存统计）写入JSON文件
+def write_json(path=None, extra=None):
+    data = {'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'), **snapshot(), **(extra or {})}
+    local_cache.write_json_atomic(path or METRICS_FILE, data)
+    return data
+
+# 汇总表：span按总耗时从高到低排列，计数器按名称排列
+def format_summary(data=None):
+    data = data or snapshot()
+    lines = [f"{'环节':<24}{'次数':>6}{'总耗时':>10}{'平均':>9}{'P95':>9}{'最大':>9}"]
+    for name, stats in sorted(data['spans'].items(), key=lambda item: item[1]['total'], reverse=True):
+        lines.append(f"{name:<26}{stats['count']:>6}{stats['total']:>10.2f}{stats['mean']:>9.3f}"
+                     f"{stats['p95']:>9.3f}{stats['max']:>9.3f}")
+    if data['counters']:
+        lines.append("计数: " + ", ".join(f"{name}={value}" for name, value in data['counters'].items()))
+    return "\n".join(lines)
@@ -1,34 +1,120 @@
 # sector_stock_analysis.py - 板块追踪和股票推荐功能模块
-import yfinance as yf
+# yfinance、pandas、numpy 均在首次使用时才导入，以加快启动
 import random
 import os
-from openai import OpenAI
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import local_cache
+import llm_utils
+import run_metrics
+import retry_policy
 
-# 初始化OpenAI客户端（需要与主程序保持一致）
-ai_service = os.environ.get("AI_SERVICE", "deepseek")
+# 候选股票筛选配置：并发数，以及找到多少只合格股票后提前结束（0表示筛选全部候选）
+SCREEN_MAX_WORKERS = int(os.environ.get("SCREEN_MAX_WORKERS", "4"))
+SCREEN_STOP_AFTER = int(os.environ.get("SCREEN_STOP_AFTER", "0"))
 
-if ai_service == "deepseek":
-    # DeepSeek API Key
-    api_key = os.environ.get("DEEPSEEK_API_KEY")
-    if not api_key:
-        raise ValueError("环境变量 DEEPSEEK_API_KEY 未设置!")
-    api_base_url = "https://api.deepseek.com/v1"
-    model_name = "deepseek-chat"
-elif ai_service == "alimind":
-    # 阿里千文API配置
-    api_key = os.environ.get("ALI_MIND_API_KEY")
-    if not api_key:
-        raise ValueError("环境变量 ALI_MIND_API_KEY 未设置!")
-    api_base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"  # 阿里千文兼容OpenAI接口的地址
-    model_name = "qwen-turbo"  # 阿里千文模型名称
-else:
-    raise ValueError(f"不支持的AI服务类型: {ai_service}")
+# 股票基本面缓存，本模块所有读取ticker.info的地方共用
+fundamentals_cache = local_cache.FundamentalsCache()
 
-# 初始化OpenAI客户端
-openai_client = OpenAI(api_key=api_key, base_url=api_base_url)
+# get_stock_data 用到的基本面字段（股价取自每次新获取的历史行情，不从基本面缓存读取）
+STOCK_INFO_FIELDS = ('longName', 'currency', 'exchange', 'forwardPE', 'trailingPE', 'profitMargins')
+
+# 行情数据源：基本信息、历史行情和批量收盘价，默认使用yfinance
+# 基准测试等场景可以把 market_data 替换为具有相同方法的其他数据源；timeout 为单次请求的超时（秒），None表示使用默认值
+class YFinanceSource:
+    def __init__(self):
+        self._info_pool = None
+        self._lock = threading.Lock()
+
+    # ticker.info 不支持超时参数，在单独的线程中获取并最多等待 timeout 秒，超时抛出 TimeoutError
+    def info(self, symbol, timeout=None):
+        import yfinance as yf
+        with self._lock:
+            if self._info_pool is None:
+                # 线程数多于筛选并发数，个别卡住的请求不会占满线程池
+                self._info_pool = ThreadPoolExecutor(max_workers=SCREEN_MAX_WORKERS * 2, thread_name_prefix="yf-info")
+        return self._info_pool.submit(lambda: yf.Ticker(symbol).info).result(timeout=timeout)
+
+    def history(self, symbol, period, timeout=None):
+        import yfinance as yf
+        return yf.Ticker(symbol).history(period=period, timeout=timeout or 10)
+
+    # 批量下载多只股票/ETF的收盘价，返回以日期为行、代码为列的DataFrame
+    def close_prices(self, symbols, period, timeout=None):
+        import pandas as pd
+        import yfinance as yf
+        data = yf.download(symbols, period=period, group_by="column", auto_adjust=True,
+                           threads=True, progress=False, timeout=timeout or 10)
+        if data is None or data.empty:
+            raise ValueError("批量下载未返回数据")
+        closes = data['Close']
+        # 只有一个代码时返回的是Series，统一转换为DataFrame
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(name=symbols[0])
+        return closes
+
+market_data = YFinanceSource()
+
+# 行情数据请求的重试策略（最多尝试次数、单次超时、退避基数，均受 RUN_DEADLINE 限制）
+market_retry_policy = retry_policy.RetryPolicy(
+    'market',
+    attempts=int(os.environ.get("MARKET_RETRIES", "2")),
+    timeout=float(os.environ.get("MARKET_TIMEOUT", "15")),
+    backoff=float(os.environ.get("MARKET_BACKOFF", "1")),
+)
+
+# 获取股票基本信息（ticker.info），优先使用本地缓存
+def get_ticker_info(symbol, fields=STOCK_INFO_FIELDS):
+    return fundamentals_cache.get(symbol, lambda: _fetch_ticker_info(symbol), fields)
+
+def _fetch_ticker_info(symbol):
+    with run_metrics.span('market.info'):
+        return market_retry_policy.call(lambda timeout: market_data.info(symbol, timeout))
+
+# 批量下载多只股票/ETF的收盘价，返回以日期为行、代码为列的DataFrame
+def download_close_prices(symbols, period):
+    with run_metrics.span('market.close_prices'):
+        return market_retry_policy.call(lambda timeout: market_data.close_prices(symbols, period, timeout))
+
+# 按列计算近3个交易日的累计涨幅，返回每列的有效交易日数和涨幅(%)
+# 累计涨幅 = (最后一天收盘价 / 三天前收盘价 - 1) * 100，数据不足或价格无效时为NaN
+def compute_three_day_returns(closes):
+    import pandas as pd
+    valid = closes.notna()
+    # 每列只保留最近4个有效收盘价
+    remaining = valid.iloc[::-1].cumsum().iloc[::-1]
+    window = closes.where(valid & (remaining <= 4))
+    start_price = window.bfill().iloc[0]
+    end_price = closes.ffill().iloc[-1]
+    valid_days = valid.sum()
+    performance = ((end_price - start_price) / start_price * 100).where((valid_days >= 4) & (start_price > 0))
+    return pd.DataFrame({'valid_days': valid_days, 'performance': performance})
+
+# 把历史行情转换为列式数组：'c'为收盘价(float64)，'t'为时间戳(int64，秒)
+def hist_to_candles(hist_data):
+    import numpy as np
+    import pandas as pd
+    if hist_data is None or hist_data.empty:
+        return {'c': np.empty(0, dtype=np.float64), 't': np.empty(0, dtype=np.int64)}
+    index = hist_data.index
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    timestamps = ((index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+    return {'c': hist_data['Close'].to_numpy(dtype=np.float64), 't': timestamps}
+
+# 向量化计算价格走势：closes可以是一维数组（单只股票）或二维数组（每行一只股票）
+# 返回 (最近days个收盘价是否逐日上涨, 整个区间的涨幅%)
+def price_trend(closes, days=3):
+    import numpy as np
+    closes = np.asarray(closes, dtype=np.float64)
+    rising = np.all(np.diff(closes[..., -days:], axis=-1) > 0, axis=-1)
+    performance = (closes[..., -1] - closes[..., 0]) / closes[..., 0] * 100
+    return rising, performance
 
 # 获取美股板块数据
 def get_top_us_sectors():
+    import pandas as pd
     try:
         # 使用主要ETF数据来代表不同板块的表现
         sector_etfs = {
@@ -47,41 +133,38 @@ def get_top_us_sectors():
         
         sector_list = []
         
+        # 一次批量请求获取全部ETF数据，至少需要4天数据才能计算3个交易日涨幅
+        try:
+            closes = download_close_prices(list(sector_etfs.values()), period="7d")  # 获取7天数据确保有足够的交易日
+            returns = compute_three_day_returns(closes)
+            download_error = None
+        except Exception as download_e:
+            returns = None
+            download_error = download_e
+        
         for sector_name, etf_symbol in sector_etfs.items():
-            try:
-                # 使用yfinance获取ETF数据，至少需要4天数据才能计算3个交易日涨幅
-                ticker = yf.Ticker(etf_symbol)
-                hist_data = ticker.history(period="7d")  # 获取7天数据确保有足够的交易日
-                
-                # 确保有至少3个完整的交易日数据
-                if len(hist_data) >= 4:  # 包含4个数据点才能计算3个交易日的涨幅
-                    # 获取最近4个交易日的收盘价（需要3个交易日的变化）
-                    closes = hist_data['Close'].iloc[-4:]  # 取最后4个数据点
-                    
-                    # 计算近3个交易日的累计涨幅
-                    # 累计涨幅 = (最后一天收盘价 / 三天前收盘价 - 1) * 100
-                    start_price = closes.iloc[0]
-                    end_price = closes.iloc[-1]
-                    
-                    if start_price > 0:
-                        performance = (end_price - start_price) / start_price * 100
-                        sector_list.append({
-                            'name': sector_name,
-                            'performance': round(performance, 2),
-                            'etf': etf_symbol
-                        })
-                else:
-                    print(f"板块{sector_name}数据不足，无法计算近3个交易日涨幅")
-                    # 使用模拟数据作为备选
+            if returns is None or etf_symbol not in returns.index:
+                print(f"获取板块{sector_name}数据失败: {str(download_error or '无返回数据')}")
+                # 如果获取失败，使用随机模拟数据
+                sector_list.append({
+                    'name': sector_name,
+                    'performance': round(random.uniform(-2, 3), 2),
+                    'etf': etf_symbol
+                })
+                continue
+            
+            valid_days, performance = returns.loc[etf_symbol]
+            # 确保有至少3个完整的交易日数据（包含4个数据点才能计算3个交易日的涨幅）
+            if valid_days >= 4:
+                if pd.notna(performance):
                     sector_list.append({
                         'name': sector_name,
-                        'performance': round(random.uniform(-2, 3), 2),
+                        'performance': round(float(performance), 2),
                         'etf': etf_symbol
                     })
-                    
-            except Exception as etf_e:
-                print(f"获取板块{sector_name}数据失败: {str(etf_e)}")
-                # 如果获取失败，使用随机模拟数据
+            else:
+                print(f"板块{sector_name}数据不足，无法计算近3个交易日涨幅")
+                # 使用模拟数据作为备选
                 sector_list.append({
                     'name': sector_name,
                     'performance': round(random.uniform(-2, 3), 2),
@@ -112,16 +195,14 @@ def get_top_us_sectors():
         ]
 
 # 获取股票数据
+@run_metrics.timed('market.stock_data')
 def get_stock_data(symbol):
     try:
-        # 使用yfinance获取股票数据
-        ticker = yf.Ticker(symbol)
-        
-        # 获取基本信息
-        info = ticker.info
+        # 获取基本信息（带缓存）
+        info = get_ticker_info(symbol)
         
         # 获取历史价格数据（最近5天）
-        hist_data = ticker.history(period="5d")
+        hist_data = market_retry_policy.call(lambda timeout: market_data.history(symbol, "5d", timeout))
         
         # 构建返回数据结构，保持与原代码兼容
         profile = {
@@ -139,24 +220,19 @@ def get_stock_data(symbol):
         pe_ratio = info.get('forwardPE', info.get('trailingPE', 0))
         metrics['metric']['peNormalizedAnnual'] = float(pe_ratio) if pe_ratio else 0
         
-        # 当前价格
-        current_price = info.get('currentPrice', info.get('regularMarketPrice', 0))
-        metrics['metric']['price'] = float(current_price) if current_price else 0
+        # 处理历史价格数据，转换为列式数组（'c'为收盘价，'t'为时间戳）
+        candles = hist_to_candles(hist_data)
+        
+        # 当前价格：使用本次获取的历史行情的最新收盘价（基本面缓存中的价格可能来自上一个交易日）
+        # 没有收盘价的股票在 evaluate_stock 中会因行情数据不足被排除
+        current_price = candles['c'][-1] if len(candles['c']) else 0
+        metrics['metric']['price'] = float(current_price) if current_price > 0 else 0
         
         # 利润率
         profit_margin = info.get('profitMargins', 0)
         # yfinance返回的利润率通常是小数形式，乘以100转为百分比
         metrics['metric']['profitMargin'] = float(profit_margin * 100) if profit_margin else 10.0
         
-        # 处理历史价格数据，转换为与原代码兼容的格式
-        candles = {'c': [], 't': []}  # 'c'为收盘价，'t'为时间戳
-        
-        if not hist_data.empty:
-            for index, row in hist_data.iterrows():
-                candles['c'].append(float(row['Close']))
-                # 转换日期为时间戳
-                candles['t'].append(int(index.timestamp()))
-        
         return {
             'profile': profile,
             'metrics': metrics,
@@ -229,51 +305,95 @@ def filter_popular_stocks(sector_trends):
     
     return selected_stocks
 
+# 评估单只股票的盈利状况和技术走势，符合条件时返回筛选结果，否则返回None
+def evaluate_stock(stock, stock_data):
+    # 检查数据是否完整
+    if not all([stock_data['profile'], stock_data['metrics'], stock_data['candles']]):
+        return None
+    
+    # 筛选条件1: 有正的盈利
+    metrics = stock_data['metrics'].get('metric', {})
+    pe_ratio = metrics.get('peNormalizedAnnual', 0)
+    profit_margin = metrics.get('profitMargin', 0)
+    current_price = metrics.get('price', 0)  # 获取当前股价
+    
+    # 避免负的市盈率或过高的市盈率
+    if pe_ratio <= 0 or pe_ratio > 100:
+        return None
+    
+    # 筛选条件2: 有正的利润率
+    if profit_margin <= 0:
+        return None
+    
+    # 筛选条件3: 近5日技术走势良好（收盘价呈上升趋势）
+    candles = stock_data['candles']
+    if 'c' not in candles or len(candles['c']) < 3:
+        return None
+    
+    # 检查最近3天是否呈上升趋势
+    rising, recent_performance = price_trend(candles['c'], days=3)
+    if not rising:
+        return None
+    
+    return {
+        'symbol': stock,
+        'name': stock_data['profile'].get('name', stock),
+        'pe_ratio': pe_ratio,
+        'profit_margin': profit_margin,
+        'current_price': current_price,  # 添加当前股价
+        'recent_performance': float(recent_performance)
+    }
+
+# 获取股票数据并记录耗时
+def _timed_get_stock_data(symbol):
+    start = time.perf_counter()
+    stock_data = get_stock_data(symbol)
+    return stock_data, time.perf_counter() - start
+
 # 筛选盈利状况和技术走势良好的股票
-def filter_quality_stocks(stocks):
+# 并发获取候选股票数据，数据到达即评估；stop_after大于0时找到足够数量的合格股票后提前结束
+# report 传入字典时写入每只股票的获取耗时（秒）和失败原因
+def filter_quality_stocks(stocks, max_workers=SCREEN_MAX_WORKERS, stop_after=SCREEN_STOP_AFTER, report=None):
     quality_stocks = []
+    latencies = {}
+    failures = {}
+    stopped_early = False
+    stocks = list(dict.fromkeys(stocks))  # 去掉重复的候选股票，保持原有顺序
     
-    for stock in stocks:
-        stock_data = get_stock_data(stock)
-        if not stock_data:
-            continue
-        
-        # 检查数据是否完整
-        if not all([stock_data['profile'], stock_data['metrics'], stock_data['candles']]):
-            continue
-        
-        try:
-            # 筛选条件1: 有正的盈利
-            metrics = stock_data['metrics'].get('metric', {})
-            pe_ratio = metrics.get('peNormalizedAnnual', 0)
-            profit_margin = metrics.get('profitMargin', 0)
-            current_price = metrics.get('price', 0)  # 获取当前股价
-            
-            # 避免负的市盈率或过高的市盈率
-            if pe_ratio <= 0 or pe_ratio > 100:
-                continue
-            
-            # 筛选条件2: 有正的利润率
-            if profit_margin <= 0:
-                continue
-            
-            # 筛选条件3: 近5日技术走势良好（收盘价呈上升趋势）
-            candles = stock_data['candles']
-            if 'c' in candles and len(candles['c']) >= 3:
-                # 检查最近3天是否呈上升趋势
-                close_prices = candles['c']
-                if close_prices[-1] > close_prices[-2] and close_prices[-2] > close_prices[-3]:
-                    quality_stocks.append({
-                        'symbol': stock,
-                        'name': stock_data['profile'].get('name', stock),
-                        'pe_ratio': pe_ratio,
-                        'profit_margin': profit_margin,
-                        'current_price': current_price,  # 添加当前股价
-                        'recent_performance': (close_prices[-1] - close_prices[0]) / close_prices[0] * 100
-                    })
-        except Exception as e:
-            print(f"分析股票 {stock} 数据时出错: {str(e)}")
-            continue
+    if stocks:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(stocks)))) as pool:
+            futures = {pool.submit(_timed_get_stock_data, stock): stock for stock in stocks}
+            for future in as_completed(futures):
+                stock = futures[future]
+                stock_data, latency = future.result()
+                latencies[stock] = round(latency, 3)
+                if not stock_data:
+                    failures[stock] = "获取数据失败"
+                    continue
+                
+                try:
+                    result = evaluate_stock(stock, stock_data)
+                except Exception as e:
+                    print(f"分析股票 {stock} 数据时出错: {str(e)}")
+                    failures[stock] = f"分析出错: {str(e)}"
+                    continue
+                
+                if result:
+                    quality_stocks.append(result)
+                    if stop_after and len(quality_stocks) >= stop_after:
+                        # 已找到足够的股票，取消尚未开始的请求
+                        stopped_early = True
+                        for pending in futures:
+                            pending.cancel()
+                        break
+    
+    if report is not None:
+        report.update({
+            'screened': len(latencies),
+            'latency': latencies,
+            'failures': failures,
+            'stopped_early': stopped_early,
+        })
     
     # 按近期表现排序
     quality_stocks.sort(key=lambda x: x['recent_performance'], reverse=True)
@@ -307,7 +427,8 @@ def analyze_sector_trends(sectors):
         return "板块趋势分析失败"
 
 # 使用LLM分析板块和股票
-def analyze_with_llm(sector_data, stock_data):
+@run_metrics.timed('llm.stock_analysis')
+def analyze_with_llm(sector_data, stock_data, on_text=None):
     # 准备提示文本
     prompt = """
     请基于以下板块和股票数据，提供专业的金融分析：
@@ -331,18 +452,18 @@ def analyze_with_llm(sector_data, stock_data):
     4. 格式清晰，使用适当的标题和小标题
     """
     
-    completion = openai_client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": "你是一位经验丰富的金融分析师，专注于股票市场和板块分析。请基于提供的数据，给出专业、客观、深入的分析和建议。特别重要：在进行技术分析,当前股价,推荐个股时，所有数据都要严格以{stock_data}为基准,不能自行修改,估算或使用其他价格来源"},
-            {"role": "user", "content": prompt.format(sector_data=sector_data, stock_data=stock_data)}
-        ]
+    # 使用带缓存的调用，数据未变化时直接复用上次的分析结果
+    # 与主程序共用同一个大模型客户端；传入 on_text 时流式返回分析内容
+    return llm_utils.chat_completion(
+        None,
+        None,
+        "你是一位经验丰富的金融分析师，专注于股票市场和板块分析。请基于提供的数据，给出专业、客观、深入的分析和建议。特别重要：在进行技术分析,当前股价,推荐个股时，所有数据都要严格以{stock_data}为基准,不能自行修改,估算或使用其他价格来源",
+        prompt.format(sector_data=sector_data, stock_data=stock_data),
+        on_text=on_text
     )
-    
-    return completion.choices[0].message.content.strip()
 
-# 生成板块和股票分析报告
-def generate_stock_report():
+# 生成板块和股票分析报告（on_text 用于流式接收大模型的分析内容）
+def generate_stock_report(on_text=None):
     try:
         print("🔄 正在获取板块数据...")
         # 获取美股板块数据（作为参考）
@@ -357,7 +478,14 @@ def generate_stock_report():
         
         # 筛选质量股票
         print("🔄 正在筛选质量股票...")
-        quality_stocks = filter_quality_stocks(popular_stocks)
+        screening_report = {}
+        quality_stocks = filter_quality_stocks(popular_stocks, report=screening_report)
+        latencies = screening_report['latency'].values()
+        if latencies:
+            print(f"   筛选股票: {screening_report['screened']}只, 失败: {len(screening_report['failures'])}只, "
+                  f"平均耗时: {sum(latencies) / len(latencies):.2f}秒, 最长耗时: {max(latencies):.2f}秒")
+        cache_stats = fundamentals_cache.stats()
+        print(f"   基本面缓存命中: {cache_stats['hits']}, 过期后台刷新: {cache_stats['stale_hits']}, 未命中: {cache_stats['misses']}")
         
         if not quality_stocks:
             return "无法筛选出符合条件的股票"
@@ -376,7 +504,7 @@ def generate_stock_report():
         
         # 使用LLM进行综合分析
         print("🧠 正在生成股票分析报告...")
-        llm_analysis = analyze_with_llm(sector_analysis, stock_data_text)
+        llm_analysis = analyze_with_llm(sector_analysis, stock_data_text, on_text)
         
         return llm_analysis
     except Exception as e:
@@ -0,0 +1,70 @@
+# stage_runner.py - 按依赖关系并发执行各阶段的简单调度器
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# 阶段定义：名称、执行函数和依赖的阶段名；执行函数接收由依赖阶段结果组成的字典
+class Stage:
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+# 执行阶段函数并记录开始和结束时间
+def _run_timed(func, inputs):
+    start = time.perf_counter()
+    result = func(inputs)
+    return result, start, time.perf_counter()
+
+# 依赖全部完成的阶段立即启动，返回 (各阶段结果, 各阶段耗时)
+# 耗时格式为 {阶段名: {'start': 相对开始时间, 'duration': 持续时间}}（秒）
+# 某个阶段抛出异常时，依赖它的阶段不再执行，全部结束后重新抛出第一个异常
+# wrap(name, func) 用于包装各阶段的执行函数（如性能分析），返回新的执行函数
+def run_stages(stages, max_workers=None, wrap=None):
+    pending = {stage.name: stage for stage in stages}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in pending]
+        if missing:
+            raise ValueError(f"阶段 {stage.name} 依赖了不存在的阶段: {missing}")
+
+    results = {}
+    timings = {}
+    errors = {}
+    running = {}
+    run_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(stages))) as pool:
+        while pending or running:
+            scheduled = True
+            while scheduled:
+                scheduled = False
+                for name, stage in list(pending.items()):
+                    if any(dep in errors for dep in stage.deps):
+                        # 上游阶段失败，跳过当前阶段
+                        errors[name] = None
+                    elif all(dep in results for dep in stage.deps):
+                        inputs = {dep: results[dep] for dep in stage.deps}
+                        func = wrap(name, stage.func) if wrap else stage.func
+                        running[pool.submit(_run_timed, func, inputs)] = name
+                    else:
+                        continue
+                    del pending[name]
+                    scheduled = True
+
+            if not running:
+                if pending:
+                    raise ValueError(f"阶段存在循环依赖: {list(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name], start, end = future.result()
+                    timings[name] = {'start': start - run_start, 'duration': end - start}
+                except Exception as e:
+                    errors[name] = e
+
+    for error in errors.values():
+        if error is not None:
+            raise error
+    return results, timings
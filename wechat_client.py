@@ -0,0 +1,179 @@
+# wechat_client.py - 微信公众号接口辅助功能：access_token本地缓存与提前刷新、模板消息群发
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import http_client
+import local_cache
+import run_metrics
+import retry_policy
+
+# 微信接口地址，可通过 WECHAT_API_BASE 指向其他地址（如本地基准测试服务）
+WECHAT_API_BASE = os.environ.get("WECHAT_API_BASE", "https://api.weixin.qq.com").rstrip('/')
+
+# access_token失效相关的错误码：40001 凭证无效，40014 凭证不合法，42001 凭证已过期
+TOKEN_ERROR_CODES = {40001, 40014, 42001}
+# 可重试的临时错误码：-1 系统繁忙，45011 接口调用太频繁
+TRANSIENT_ERROR_CODES = {-1, 45011}
+
+# 获取token和发送消息的重试策略：已生成的报告无论如何都要推送，因此不受运行截止时间限制
+token_retry_policy = retry_policy.RetryPolicy('wechat_token', attempts=3, timeout=10, backoff=1.0, use_deadline=False)
+send_retry_policy = retry_policy.RetryPolicy('wechat', attempts=3, timeout=10, backoff=1.0, use_deadline=False)
+
+# access_token保存目录：token可以直接调用接口向所有订阅用户发消息，不能放在会被 actions/cache 保存的缓存目录中
+# （拉取请求触发的工作流也能恢复主分支的缓存）
+WECHAT_TOKEN_DIR = os.environ.get("WECHAT_TOKEN_DIR", ".wechat")
+
+# access_token管理：持久化token及过期时间，过期前 refresh_margin 秒主动刷新
+# 微信限制每日获取token的次数，推送间隔小于token有效期（2小时）时多次运行之间复用同一个token
+class AccessTokenManager:
+    def __init__(self, app_id, app_secret, refresh_margin=300, cache_dir=None):
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.refresh_margin = refresh_margin
+        self.path = os.path.join(cache_dir or WECHAT_TOKEN_DIR, "wechat_token.json")
+        self.refresh_count = 0
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin
+
+    def _load(self):
+        cached = local_cache.read_json(self.path)
+        # 只使用同一个公众号的token
+        if cached and cached.get('app_id') == self.app_id.strip():
+            self._token = cached.get('access_token')
+            self._expires_at = cached.get('expires_at', 0)
+
+    def _refresh(self):
+        # 获取access token的url
+        url = '{}/cgi-bin/token?grant_type=client_credential&appid={}&secret={}' \
+            .format(WECHAT_API_BASE, self.app_id.strip(), self.app_secret.strip())
+        with run_metrics.span('wechat.token'):
+            response = token_retry_policy.call(lambda timeout: http_client.get(url, timeout=timeout).json())
+        self.refresh_count += 1
+        run_metrics.incr('wechat.token_refresh')
+        access_token = response.get('access_token')
+        if not access_token:
+            self._token = None
+            self._expires_at = 0
+            return None
+
+        self._token = access_token
+        self._expires_at = time.time() + int(response.get('expires_in', 7200))
+        try:
+            local_cache.write_json_atomic(self.path, {
+                'app_id': self.app_id.strip(),
+                'access_token': self._token,
+                'expires_at': self._expires_at,
+            })
+        except OSError:
+            pass
+        return access_token
+
+    # 使用 stale_token 发送失败后刷新token；若其他线程已经刷新过则直接返回新token，避免重复获取
+    def refresh_token(self, stale_token):
+        with self._lock:
+            if self._token != stale_token and self._is_fresh():
+                return self._token
+            return self._refresh()
+
+    # 返回有效的access_token；force_refresh=True 时忽略缓存重新获取（用于token被判定失效时）
+    def get_token(self, force_refresh=False):
+        with self._lock:
+            if not force_refresh:
+                if not self._is_fresh():
+                    self._load()
+                if self._is_fresh():
+                    return self._token
+            return self._refresh()
+
+# 令牌桶限速器：平均每秒最多 rate 次，允许 burst 次突发，多线程共享
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+# 读取推送对象：OPEN_IDS_FILE 文件（每行一个，#开头为注释）和 OPEN_IDS 环境变量（逗号或空白分隔），
+# 再加上默认的 OPEN_ID，去重后保持原有顺序
+def load_recipients(default_open_id=None):
+    recipients = []
+    path = os.environ.get("OPEN_IDS_FILE")
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            recipients.extend(line.split('#', 1)[0] for line in f)
+    recipients.extend(re.split(r'[\s,;]+', os.environ.get("OPEN_IDS", "")))
+    if default_open_id:
+        recipients.append(default_open_id)
+    return list(dict.fromkeys(openid.strip() for openid in recipients if openid and openid.strip()))
+
+# 发送单条模板消息
+@run_metrics.timed('wechat.send')
+def send_template_message(access_token, body, timeout=None):
+    url = '{}/cgi-bin/message/template/send?access_token={}'.format(WECHAT_API_BASE, access_token)
+    return http_client.post(url, json.dumps(body), timeout=timeout).json()
+
+# 向多个用户并发发送同一条模板消息（body中不需要touser）
+# 按 rate 限速，遇到临时错误或网络异常时按 policy 退避重试，token失效时刷新后重试
+# 返回发送汇总：总数、成功数、失败数、失败详情、耗时和吞吐量（条/秒）
+def send_template_messages(token_manager, body, recipients, rate=20, max_workers=8, policy=send_retry_policy):
+    limiter = RateLimiter(rate)
+
+    def send_one(openid):
+        message = dict(body, touser=openid)
+        result = None
+        for attempt in range(policy.attempts):
+            limiter.acquire()
+            access_token = token_manager.get_token()
+            try:
+                result = send_template_message(access_token, message, timeout=policy.attempt_timeout())
+            except Exception as e:
+                result = {'errcode': None, 'errmsg': str(e)}
+
+            errcode = result.get('errcode')
+            if errcode == 0:
+                return result
+            if errcode in TOKEN_ERROR_CODES:
+                token_manager.refresh_token(access_token)
+            elif errcode is not None and errcode not in TRANSIENT_ERROR_CODES:
+                # 用户未关注、模板错误等无法通过重试解决的错误
+                return result
+            if attempt == policy.attempts - 1 or not policy.sleep_before_retry(attempt):
+                break
+        return result
+
+    start = time.perf_counter()
+    results = {}
+    if recipients:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(recipients)))) as pool:
+            results = dict(zip(recipients, pool.map(send_one, recipients)))
+    elapsed = time.perf_counter() - start
+
+    failures = {openid: result for openid, result in results.items() if result.get('errcode') != 0}
+    return {
+        'total': len(results),
+        'success': len(results) - len(failures),
+        'failed': len(failures),
+        'failures': failures,
+        'elapsed': round(elapsed, 3),
+        'throughput': round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+    }